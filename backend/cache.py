@@ -0,0 +1,75 @@
+import logging
+import os
+from typing import Any, Optional
+import orjson
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+# Redis client (caching is skipped entirely when REDIS_URL is not set)
+redis_url = os.getenv("REDIS_URL")
+
+redis_client: Optional["aioredis.Redis"] = None
+if REDIS_AVAILABLE and redis_url:
+    redis_client = aioredis.from_url(redis_url)
+
+# Video lists change rarely; feedback for a live session changes every few seconds
+VIDEOS_CACHE_TTL = 60
+FEEDBACK_CACHE_TTL = 10
+
+
+def videos_cache_key(user_id: str) -> str:
+    return f"videos:{user_id}"
+
+
+def feedback_cache_key(session_id: str) -> str:
+    return f"fb:{session_id}"
+
+
+async def cache_get(key: str) -> Optional[Any]:
+    """Return the cached JSON value for key, or None on a miss"""
+    if not redis_client:
+        return None
+
+    try:
+        cached = await redis_client.get(key)
+    except Exception as e:
+        logger.error("Error reading cache key %s: %s", key, e)
+        return None
+
+    return orjson.loads(cached) if cached else None
+
+
+async def cache_set(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    """Cache a JSON-serializable value; no ttl means keep until invalidated"""
+    if not redis_client:
+        return
+
+    try:
+        if ttl is None:
+            await redis_client.set(key, orjson.dumps(value))
+        else:
+            await redis_client.setex(key, ttl, orjson.dumps(value))
+    except Exception as e:
+        logger.error("Error writing cache key %s: %s", key, e)
+
+
+async def cache_delete(*keys: str) -> None:
+    """Invalidate cached entries"""
+    if not redis_client or not keys:
+        return
+
+    try:
+        await redis_client.delete(*keys)
+    except Exception as e:
+        logger.error("Error invalidating cache keys %s: %s", keys, e)
@@ -4,6 +4,6 @@ AI-powered public speaking feedback system
 """
 
 from .feedback_agent import FeedbackAgent
-from .feedback_utils import compress_images_for_gemini, analyze_audio_tone_fast
+from .feedback_utils import analyze_audio_tone_fast
 
-__all__ = ['FeedbackAgent', 'compress_images_for_gemini', 'analyze_audio_tone_fast']
+__all__ = ['FeedbackAgent', 'analyze_audio_tone_fast']
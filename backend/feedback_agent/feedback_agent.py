@@ -3,14 +3,31 @@ Feedback Agent - AI-powered public speaking coach
 Uses Gemini API to analyze speaker's performance in real-time
 """
 
+import atexit
+import logging
 import os
+import pybase64
 import tempfile
-import base64
-from typing import List, Optional
-from PIL import Image
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from collections import deque
+from typing import Deque, List, Optional, Tuple, Union
+from PIL import Image, UnidentifiedImageError
 import io
 
-from .feedback_utils import analyze_audio_tone_fast, compress_images_for_gemini
+from .feedback_utils import (
+    JPEG_EOI,
+    JPEG_MAGIC,
+    SOUNDFILE_MAGIC,
+    analyze_audio_tone_fast,
+    compress_image_for_gemini,
+    fits_target_size,
+    sample_frames,
+)
+
+logger = logging.getLogger(__name__)
 
 try:
     from google import genai
@@ -20,7 +37,7 @@ except ImportError:
     genai = None
     types = None
     GENAI_AVAILABLE = False
-    print("Warning: google-genai not installed. AI feedback will be disabled.")
+    logger.warning("google-genai not installed. AI feedback will be disabled.")
 
 
 SYSTEM_PROMPT = (
@@ -35,6 +52,109 @@ SYSTEM_PROMPT = (
     "Feedback should be precise and actionable, one sentence. Use previous feedback for consistency."
 )
 
+# Frames are downscaled to fit within this box before being sent to Gemini
+TARGET_SIZE = (640, 480)
+MAX_IMAGES = 4
+
+# Number of previous feedbacks kept as prompt context
+HISTORY_SIZE = 3
+
+
+# Warm worker threads shared by all agents for per-frame image prep
+_FRAME_POOL = ThreadPoolExecutor(max_workers=MAX_IMAGES, thread_name_prefix="frame-prep")
+atexit.register(_FRAME_POOL.shutdown)
+
+_thread_local = threading.local()
+
+
+def _scratch_buffer() -> io.BytesIO:
+    """Return this thread's JPEG scratch buffer, emptied for reuse"""
+    scratch = getattr(_thread_local, "scratch", None)
+    if scratch is None:
+        scratch = _thread_local.scratch = io.BytesIO()
+    scratch.seek(0)
+    scratch.truncate()
+    return scratch
+
+
+def _decode_base64_payload(data: str) -> bytes:
+    """
+    Decode base64 data, stripping a leading ``data:...;base64,`` prefix
+    
+    The prefix is only searched for in the first 64 characters, and the
+    payload is decoded through a memoryview so the (possibly multi-MB)
+    string is copied once rather than sliced and then re-encoded.
+    """
+    start = data.index(",", 0, 64) + 1 if data.startswith("data:") else 0
+    return pybase64.b64decode(memoryview(data.encode("ascii"))[start:], validate=False)
+
+
+def _prepare_frame(frame: Union[str, bytes], target_size: Tuple[int, int] = TARGET_SIZE) -> Optional[dict]:
+    """
+    Turn one frame into a Gemini ``inline_data`` part
+    
+    Args:
+        frame: Raw image bytes, or a base64 encoded frame (data URL prefix allowed)
+        target_size: Box the frame must fit in (width, height)
+    
+    Returns:
+        The ``inline_data`` part, or None if the frame is unusable
+    """
+    try:
+        if isinstance(frame, bytes):
+            img_bytes = frame
+        else:
+            img_bytes = _decode_base64_payload(frame)
+        
+        # Verify it's actually image data
+        if len(img_bytes) < 100:
+            logger.warning("Frame has suspicious size (%s bytes), skipping", len(img_bytes))
+            return None
+        
+        # Open lazily - only the header is parsed until load()
+        img = Image.open(io.BytesIO(img_bytes))
+        
+        # Already a small enough, complete JPEG: forward the bytes as-is
+        # (a missing end-of-image marker means the frame was cut short)
+        if (
+            img_bytes[:3] == JPEG_MAGIC
+            and img_bytes.endswith(JPEG_EOI)
+            and fits_target_size(img.size, target_size)
+        ):
+            return {
+                "inline_data": {
+                    "mime_type": "image/jpeg",
+                    "data": pybase64.b64encode_as_string(img_bytes),
+                }
+            }
+        
+        # A single decode; truncated or corrupt data raises OSError from load()
+        img.load()
+        img = compress_image_for_gemini(img, target_size)
+        
+        # Always re-encode as JPEG into this worker's reusable buffer
+        scratch = _scratch_buffer()
+        img.save(scratch, format="JPEG", quality=85, optimize=False)
+        
+        return {
+            "inline_data": {
+                "mime_type": "image/jpeg",
+                "data": pybase64.b64encode_as_string(scratch.getvalue()),
+            }
+        }
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Skipping undecodable frame: %s", e)
+        return None
+    except Exception as e:
+        logger.error("Error processing frame: %s", e)
+        return None
+
+
+@lru_cache(maxsize=4)
+def _get_client(api_key: str):
+    """Shared Gemini client per API key, so sessions reuse one channel/TLS setup"""
+    return genai.Client(api_key=api_key)
+
 
 class FeedbackAgent:
     """
@@ -49,30 +169,31 @@ class FeedbackAgent:
             api_key: Google Gemini API key (will use env var if not provided)
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-        self.chat_history: List[str] = []
+        # Only the most recent feedbacks are ever fed back into the prompt
+        self.chat_history: Deque[str] = deque(maxlen=HISTORY_SIZE)
         self.client = None
         self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
 
         if GENAI_AVAILABLE and types and self.api_key:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = _get_client(self.api_key)
             except Exception as exc:  # pylint: disable=broad-except
                 self.client = None
-                print(f"Failed to initialize Gemini client: {exc}")
+                logger.error("Failed to initialize Gemini client: %s", exc)
         else:
-            print("Warning: Gemini AI not configured. Feedback will be placeholder.")
+            logger.warning("Gemini AI not configured. Feedback will be placeholder.")
     
     def analyze_segment(
         self, 
-        frames: List[str], 
-        audio_data: Optional[str] = None
+        frames: List[Union[str, bytes]], 
+        audio_data: Optional[Union[str, bytes]] = None
     ) -> str:
         """
         Analyze a segment of the presentation (frames + audio)
         
         Args:
-            frames: List of base64 encoded image frames
-            audio_data: Optional base64 encoded audio data
+            frames: List of image frames (raw bytes or base64 encoded)
+            audio_data: Optional audio data (raw bytes or base64 encoded)
         
         Returns:
             Feedback string
@@ -81,95 +202,56 @@ class FeedbackAgent:
             return "AI feedback unavailable (API not configured)"
         
         try:
-            # Convert base64 frames to PIL Images
-            images = []
-            for idx, frame_b64 in enumerate(frames):
-                try:
-                    # Clean up base64 data
-                    if "base64," in frame_b64:
-                        frame_b64 = frame_b64.split("base64,")[1]
-                    
-                    # Decode base64 to bytes
-                    img_bytes = base64.b64decode(frame_b64)
-                    
-                    # Verify it's actually image data
-                    if len(img_bytes) < 100:
-                        print(f"Warning: Frame {idx} has suspicious size ({len(img_bytes)} bytes), skipping")
-                        continue
-                    
-                    # Try to open as image
-                    img = Image.open(io.BytesIO(img_bytes))
-                    
-                    # Verify image was loaded properly
-                    img.verify()
-                    
-                    # Re-open since verify() closes the file
-                    img = Image.open(io.BytesIO(img_bytes))
-                    
-                    images.append(img)
-                    print(f"Successfully loaded frame {idx}: {img.size} {img.mode}")
-                    
-                except Exception as e:
-                    print(f"Error processing frame {idx}: {str(e)}")
-                    continue
+            # Decode/compress an even sample in parallel; frames that fail are
+            # replaced from a fresh sample of the untried ones, so MAX_IMAGES
+            # valid images go out whenever the buffer holds that many
+            prepared = {}
+            untried = list(range(len(frames)))
+            while untried and len(prepared) < MAX_IMAGES:
+                picked = sample_frames(untried, MAX_IMAGES - len(prepared))
+                parts = _FRAME_POOL.map(_prepare_frame, [frames[i] for i in picked], repeat(TARGET_SIZE))
+                prepared.update((i, part) for i, part in zip(picked, parts) if part)
+                picked_set = set(picked)
+                untried = [i for i in untried if i not in picked_set]
+            image_parts = [prepared[i] for i in sorted(prepared)]
             
-            if not images:
+            if not image_parts:
                 return "Error: No valid image frames received for analysis"
             
-            print(f"Successfully loaded {len(images)} frames for analysis.")
-            
-            # Compress images for Gemini
-            images = compress_images_for_gemini(images, max_images=4, target_size=(640, 480))
+            logger.debug("Successfully prepared %s frames for analysis.", len(image_parts))
             
             # Analyze audio if provided
             tone_report = "No audio data"
             if audio_data:
                 try:
-                    # Save audio to temp file for analysis
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as audio_file:
-                        if "base64," in audio_data:
-                            audio_data = audio_data.split("base64,")[1]
-                        
-                        audio_bytes = base64.b64decode(audio_data)
-                        audio_file.write(audio_bytes)
-                        audio_fp = audio_file.name
-                    
-                    tone_report = analyze_audio_tone_fast(audio_fp)
-                    
-                    # Cleanup temp file
-                    os.unlink(audio_fp)
+                    audio_bytes = (
+                        audio_data if isinstance(audio_data, bytes)
+                        else _decode_base64_payload(audio_data)
+                    )
+                    if audio_bytes.startswith(SOUNDFILE_MAGIC):
+                        # soundfile reads these straight from memory
+                        tone_report = analyze_audio_tone_fast(io.BytesIO(audio_bytes))
+                    else:
+                        # WebM/Opus only decodes through audioread, which needs a path
+                        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
+                            tmp.write(audio_bytes)
+                        try:
+                            tone_report = analyze_audio_tone_fast(tmp.name)
+                        finally:
+                            os.unlink(tmp.name)
                 except Exception as e:
                     tone_report = f"Audio analysis failed: {str(e)[:50]}"
             
             # Build prompt including system guidance and context
-            prompt = SYSTEM_PROMPT
-            if self.chat_history:
-                prompt += "\n\nPrevious feedbacks:\n" + "\n".join(self.chat_history[-3:])  # Only last 3 for context
-            prompt += f"\n\nSpeaker voice/tone: {tone_report}"
+            history = "Previous feedbacks:\n" + "\n".join(self.chat_history) if self.chat_history else ""
+            prompt = "\n\n".join(filter(None, [
+                SYSTEM_PROMPT,
+                history,
+                f"Speaker voice/tone: {tone_report}",
+            ]))
             
             # Get feedback from Gemini
-            parts = [{"text": prompt}]
-            for img in images:
-                buffered = io.BytesIO()
-                # Default to JPEG to keep size manageable
-                img_format = (img.format or "JPEG").upper()
-                mime_type = "image/jpeg" if img_format == "JPEG" else f"image/{img_format.lower()}"
-                try:
-                    img.save(buffered, format=img_format)
-                except ValueError:
-                    # Fallback to JPEG if the specific format isn't supported for saving
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="JPEG")
-                    mime_type = "image/jpeg"
-
-                image_bytes = buffered.getvalue()
-                image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-                parts.append({
-                    "inline_data": {
-                        "mime_type": mime_type,
-                        "data": image_b64,
-                    }
-                })
+            parts = [{"text": prompt}, *image_parts]
 
             contents = [{"role": "user", "parts": parts}]
 
@@ -187,7 +269,7 @@ class FeedbackAgent:
             
         except Exception as e:
             error_msg = f"Error analyzing segment: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def reset_history(self):
@@ -196,4 +278,4 @@ class FeedbackAgent:
     
     def get_history(self) -> List[str]:
         """Get the feedback history"""
-        return self.chat_history.copy()
+        return list(self.chat_history)
@@ -3,54 +3,160 @@ Utility functions for the feedback agent
 Handles audio analysis and image compression for Gemini API
 """
 
+import logging
 import os
 import numpy as np
+import PIL
 from PIL import Image
-from typing import List
+from typing import BinaryIO, List, Tuple, TypeVar, Union
 import io
 
+logger = logging.getLogger(__name__)
 
-def compress_images_for_gemini(
-    images: List[Image.Image], 
-    max_images: int = 6, 
-    target_size: tuple = (640, 480)
-) -> List[Image.Image]:
+T = TypeVar("T")
+
+# Leading bytes of every JPEG stream (SOI marker + first marker prefix)
+JPEG_MAGIC = b"\xff\xd8\xff"
+# End-of-image marker closing a complete JPEG stream
+JPEG_EOI = b"\xff\xd9"
+
+# Container signatures libsndfile decodes straight from a file-like object
+# (WAV, Ogg, FLAC); anything else, such as browser WebM, needs a real path
+SOUNDFILE_MAGIC = (b"RIFF", b"OggS", b"fLaC")
+
+# Pillow-SIMD releases carry a ".postN" suffix on top of the upstream version
+PILLOW_SIMD = ".post" in PIL.__version__
+logger.info("Loaded Pillow %s (%s build)", PIL.__version__, "SIMD" if PILLOW_SIMD else "stock")
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+    logger.warning("numba not installed. Audio metrics will use the NumPy/librosa fallback.")
+
+
+if NUMBA_AVAILABLE:
+    # Eager signature so compilation happens at import, not on the first chunk
+    @njit("UniTuple(float64, 2)(float32[::1])", cache=True, fastmath=True)
+    def _rms_zcr(y):
+        """Single-pass RMS and zero-crossing rate over a float32 signal"""
+        sum_sq = 0.0
+        zc = 0
+        for i in range(y.shape[0]):
+            sum_sq += y[i] * y[i]
+            if i > 0 and (y[i - 1] >= 0) != (y[i] >= 0):
+                zc += 1
+        return np.sqrt(sum_sq / y.shape[0]), zc / y.shape[0]
+
+    @njit("float64(float32[::1], int64, float64, float64)", cache=True, fastmath=True)
+    def _yin_f0(y, sr, fmin, fmax):
+        """
+        Median YIN F0 estimate over ~25 ms frames, 0.0 if nothing is voiced
+        
+        Uses the YIN difference function with cumulative mean normalization,
+        so no spectrogram is ever materialized.
+        """
+        window = int(0.025 * sr)
+        tau_min = max(2, int(sr / fmax))
+        tau_max = int(sr / fmin)
+        threshold = 0.1
+        
+        n_frames = (y.shape[0] - tau_max - 1) // window
+        if n_frames <= 0:
+            return 0.0
+        
+        diff = np.empty(tau_max + 1)
+        estimates = np.empty(n_frames)
+        n_voiced = 0
+        for frame in range(n_frames):
+            start = frame * window
+            
+            # Skip near-silent frames - their "pitch" is just noise
+            energy = 0.0
+            for i in range(start, start + window):
+                energy += y[i] * y[i]
+            if energy < 1e-6 * window:
+                continue
+            
+            # Difference function with cumulative mean normalization
+            diff[0] = 1.0
+            running_sum = 0.0
+            for tau in range(1, tau_max + 1):
+                d = 0.0
+                for i in range(start, start + window):
+                    delta = y[i] - y[i + tau]
+                    d += delta * delta
+                running_sum += d
+                diff[tau] = d * tau / running_sum if running_sum > 0 else 1.0
+            
+            # First dip under the threshold, followed down to its local minimum
+            tau = tau_min
+            while tau <= tau_max:
+                if diff[tau] < threshold:
+                    while tau + 1 <= tau_max and diff[tau + 1] < diff[tau]:
+                        tau += 1
+                    estimates[n_voiced] = sr / tau
+                    n_voiced += 1
+                    break
+                tau += 1
+        
+        if n_voiced == 0:
+            return 0.0
+        return np.median(estimates[:n_voiced])
+else:
+    def _rms_zcr(y: np.ndarray) -> Tuple[float, float]:
+        """Single-pass RMS and zero-crossing rate over a float32 signal"""
+        rms = float(np.sqrt(np.mean(y**2)))
+        zcr = np.count_nonzero((y[1:] >= 0) != (y[:-1] >= 0)) / len(y)
+        return rms, zcr
+
+    # Pure-Python YIN would be far slower than piptrack; callers fall back to it
+    _yin_f0 = None
+
+
+def fits_target_size(size: Tuple[int, int], target_size: Tuple[int, int]) -> bool:
+    """Check whether an image of ``size`` already fits inside ``target_size``"""
+    return size[0] <= target_size[0] and size[1] <= target_size[1]
+
+
+def sample_frames(items: List[T], max_items: int) -> List[T]:
+    """Evenly sample at most ``max_items`` entries from ``items``, keeping the newest"""
+    if len(items) > max_items:
+        idx = np.linspace(0, len(items) - 1, num=max_items, dtype=int)
+        items = [items[i] for i in idx]
+    return items
+
+
+def compress_image_for_gemini(img: Image.Image, target_size: tuple = (640, 480)) -> Image.Image:
     """
-    Compress and resize images for Gemini API to reduce token usage
+    Resize a single image to fit ``target_size`` and convert it to RGB
     
     Args:
-        images: List of PIL Images
-        max_images: Maximum number of images to return
+        img: PIL Image (resized in place)
         target_size: Target size for resizing (width, height)
     
     Returns:
-        List of compressed PIL Images
+        Compressed PIL Image
     """
-    # Sample images if we have too many
-    if len(images) > max_images:
-        step = len(images) // max_images
-        images = [images[i] for i in range(0, len(images), step)][:max_images]
+    # Resize to target size while maintaining aspect ratio
+    img.thumbnail(target_size, Image.Resampling.LANCZOS)
     
-    compressed = []
-    for img in images:
-        # Resize to target size while maintaining aspect ratio
-        img.thumbnail(target_size, Image.Resampling.LANCZOS)
-        
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        compressed.append(img)
+    # Convert to RGB if needed
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
     
-    return compressed
+    return img
 
 
-def analyze_audio_tone_fast(audio_path: str) -> str:
+def analyze_audio_tone_fast(audio_path: Union[str, BinaryIO]) -> str:
     """
     Fast audio analysis using librosa for tone, energy, and pace
     
     Args:
-        audio_path: Path to audio file (WAV format)
+        audio_path: Path to an audio file, or a file-like object holding WAV/Ogg/FLAC
+            data. Only paths fall back to audioread/ffmpeg for other formats.
     
     Returns:
         String description of audio characteristics
@@ -59,7 +165,8 @@ def analyze_audio_tone_fast(audio_path: str) -> str:
         import librosa
         
         # Load audio file
-        y, sr = librosa.load(audio_path, sr=16000, duration=5.0)  # Only analyze up to 5 seconds
+        # Coarse labels only - 8 kHz still covers speech F0 with plenty of headroom
+        y, sr = librosa.load(audio_path, sr=8000, duration=5.0)  # Only analyze up to 5 seconds
         
         if len(y) == 0:
             return "No audio detected"
@@ -70,19 +177,21 @@ def analyze_audio_tone_fast(audio_path: str) -> str:
         energy_variance = np.std(rms)
         
         # Calculate pitch
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        pitch_values = []
-        for t in range(pitches.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            if pitch > 0:
-                pitch_values.append(pitch)
-        
-        avg_pitch = np.mean(pitch_values) if pitch_values else 0
+        if _yin_f0 is not None:
+            avg_pitch = _yin_f0(np.ascontiguousarray(y, dtype=np.float32), sr, 75.0, 400.0)
+        else:
+            pitches, magnitudes = librosa.piptrack(y=y, sr=sr, n_fft=1024, hop_length=512)
+            # Strongest bin per frame, picked for all frames in one pass
+            index = magnitudes.argmax(axis=0)
+            pitch = pitches[index, np.arange(pitches.shape[1])]
+            pitch_values = pitch[pitch > 0]
+            
+            avg_pitch = pitch_values.mean() if pitch_values.size else 0.0
         
         # Calculate speaking rate (zero-crossing rate as proxy)
         zcr = librosa.feature.zero_crossing_rate(y)[0]
-        avg_zcr = np.mean(zcr)
+        # Pace thresholds were tuned on 16 kHz audio; ZCR is per sample, so rescale
+        avg_zcr = np.mean(zcr) * sr / 16000
         
         # Interpret results
         volume_desc = "loud" if avg_energy > 0.05 else "moderate" if avg_energy > 0.02 else "quiet"
@@ -111,8 +220,6 @@ def analyze_audio_segment(audio_bytes: bytes, sample_rate: int = 48000) -> str:
         String description of audio characteristics
     """
     try:
-        import librosa
-        
         # Convert bytes to numpy array
         audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
         
@@ -122,18 +229,12 @@ def analyze_audio_segment(audio_bytes: bytes, sample_rate: int = 48000) -> str:
         if len(y) == 0:
             return "No audio detected"
         
-        # Calculate basic metrics
-        rms = np.sqrt(np.mean(y**2))
+        # Calculate volume (RMS) and pace (zero-crossing rate) in one pass
+        rms, zcr = _rms_zcr(y)
         volume_desc = "loud" if rms > 0.05 else "moderate" if rms > 0.02 else "quiet"
-        
-        # Calculate zero-crossing rate for pace
-        zero_crossings = np.sum(np.abs(np.diff(np.sign(y)))) / 2
-        zcr = zero_crossings / len(y)
         pace_desc = "fast" if zcr > 0.08 else "moderate" if zcr > 0.04 else "slow"
         
         return f"Volume: {volume_desc}, Pace: {pace_desc}"
         
-    except ImportError:
-        return "Audio analysis unavailable"
     except Exception as e:
         return f"Audio analysis error: {str(e)[:50]}"
@@ -1,19 +1,56 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, Deque, List, Any, Set, Union
+from collections import deque
 from datetime import datetime
-import json
-import base64
+import orjson
 import asyncio
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
 import uuid
+from dotenv import load_dotenv
+
+# Load environment variables (LOG_LEVEL is needed before the app modules import)
+load_dotenv()
+
+# Log records are queued and written by a background thread, so neither the
+# event loop nor worker threads block on stream I/O. DEBUG output is off
+# unless LOG_LEVEL asks for it. Configured before the app modules are imported
+# so their import-time messages go through the same handler.
+log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(log_queue)],
+)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 from video_recorder import (
     VideoRecorder,
     upload_to_supabase,
     get_user_videos,
+    get_feedback_segments,
     save_feedback_segments_to_supabase,
 )
 from feedback_agent import FeedbackAgent
+from cache import (
+    FEEDBACK_CACHE_TTL,
+    VIDEOS_CACHE_TTL,
+    cache_delete,
+    cache_get,
+    cache_set,
+    feedback_cache_key,
+    videos_cache_key,
+)
+from session_store import session_store
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="SpeakFlow API", version="1.0.0")
 
@@ -37,6 +74,100 @@ class Item(BaseModel):
     price: float
     quantity: int = 1
 
+# Binary WebSocket frames: 1-byte message type + 4-byte big-endian timestamp
+# (ms since capture start) + raw payload. JSON control messages can be sent as
+# text or as binary starting with "{" (0x7B), which is never a message type.
+BINARY_HEADER_SIZE = 5
+BINARY_MESSAGE_TYPES = {
+    0x01: "frame",
+    0x02: "video_chunk",
+    0x03: "video_complete",
+    0x04: "audio",
+    # Several frames in one message: repeated [4-byte big-endian length][image]
+    0x05: "frames",
+}
+# Media payloads are only accepted in binary form (no base64 in JSON)
+MEDIA_MESSAGE_TYPES = frozenset(BINARY_MESSAGE_TYPES.values())
+
+def unpack_frame_batch(payload: bytes) -> List[bytes]:
+    """Split a binary frame batch into its individual images"""
+    view = memoryview(payload)
+    items: List[bytes] = []
+    offset = 0
+    while offset + 4 <= len(view):
+        size = int.from_bytes(view[offset:offset + 4], "big")
+        offset += 4
+        if offset + size > len(view):
+            logger.warning("Truncated frame batch record (%s of %s bytes); dropping the rest", len(view) - offset, size)
+            break
+        items.append(bytes(view[offset:offset + size]))
+        offset += size
+    return items
+
+def parse_binary_message(data: bytes) -> Dict[str, Any]:
+    """Unpack a binary frame into the same shape as a JSON message"""
+    if len(data) < BINARY_HEADER_SIZE:
+        return {"type": None}
+    message = {
+        "type": BINARY_MESSAGE_TYPES.get(data[0]),
+        "timestamp_ms": int.from_bytes(data[1:BINARY_HEADER_SIZE], "big"),
+        "data": data[BINARY_HEADER_SIZE:],
+    }
+    if message["type"] == "frames":
+        message["items"] = unpack_frame_batch(message.pop("data"))
+    return message
+
+# Pre-encoded payloads for fixed-shape messages on the hot path. Status
+# templates stop short of the closing brace so only the count is formatted.
+PONG_MESSAGE = orjson.dumps({"type": "pong"})
+# Keepalives arrive in this canonical form (JSON.stringify / orjson output)
+# and are answered without being parsed
+PING_MESSAGE = orjson.dumps({"type": "ping"})
+PING_TEXT = PING_MESSAGE.decode()
+RECORDING_STATUS = orjson.dumps({"type": "status", "message": "Recording..."})[:-1]
+PROCESSING_STATUS = orjson.dumps({"type": "status", "message": "Processing..."})[:-1]
+
+def status_message(template: bytes, segments_processed: int) -> bytes:
+    """Complete a pre-encoded status template with the processed-segment count"""
+    return template + b',"segments_processed":%d}' % segments_processed
+
+# Several queued events are coalesced into {"type": "batch", "items": [...]}
+BATCH_PREFIX = b'{"type":"batch","items":['
+BATCH_SUFFIX = b"]}"
+
+async def flush_outbound(websocket: WebSocket, outbound: "asyncio.Queue[Optional[bytes]]") -> None:
+    """
+    Send queued (pre-encoded) messages, one WebSocket frame per wake-up
+
+    Waits for the first message, then drains whatever else is already
+    queued and sends it all together. A None entry stops the flusher once
+    everything before it has been sent.
+    """
+    while True:
+        item = await outbound.get()
+        if item is None:
+            return
+
+        items = [item]
+        closing = False
+        while True:
+            try:
+                item = outbound.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                closing = True
+                break
+            items.append(item)
+
+        if len(items) == 1:
+            await websocket.send_bytes(items[0])
+        else:
+            await websocket.send_bytes(BATCH_PREFIX + b",".join(items) + BATCH_SUFFIX)
+
+        if closing:
+            return
+
 # Routes
 @app.get("/")
 async def root():
@@ -79,6 +210,11 @@ async def get_item(item_id: int):
 async def get_videos(user_id: str):
     """Get all videos for a specific user"""
     try:
+        cache_key = videos_cache_key(user_id)
+        cached = await cache_get(cache_key)
+        if cached:
+            return cached
+        
         videos = await get_user_videos(user_id)
         
         if videos is None:
@@ -88,14 +224,16 @@ async def get_videos(user_id: str):
                 "videos": []
             }
         
-        return {
+        result = {
             "success": True,
             "user_id": user_id,
             "count": len(videos),
             "videos": videos
         }
+        await cache_set(cache_key, result, VIDEOS_CACHE_TTL)
+        return result
     except Exception as e:
-        print(f"Error in get_videos endpoint: {e}")
+        logger.error("Error in get_videos endpoint: %s", e)
         return {
             "success": False,
             "message": str(e),
@@ -106,47 +244,40 @@ async def get_videos(user_id: str):
 async def get_feedback(session_id: str):
     """Get AI feedback segments for a specific session"""
     try:
-        from supabase import create_client
-        import os
-        from dotenv import load_dotenv
+        cache_key = feedback_cache_key(session_id)
+        cached = await cache_get(cache_key)
+        if cached:
+            return cached
         
-        load_dotenv()
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")
+        feedback_segments = await get_feedback_segments(session_id)
         
-        if not supabase_url or not supabase_key:
+        if feedback_segments is None:
             return {
                 "success": False,
-                "message": "Supabase configuration not found",
+                "message": "Error retrieving feedback",
                 "feedback": []
             }
         
-        supabase = create_client(supabase_url, supabase_key)
-        
-        # Query feedback segments for the session
-        response = supabase.table("ai_feedback_segments")\
-            .select("*")\
-            .eq("session_id", session_id)\
-            .order("start_seconds", desc=False)\
-            .execute()
-        
-        feedback_segments = response.data if response.data else []
-        
-        return {
+        result = {
             "success": True,
             "session_id": session_id,
             "count": len(feedback_segments),
             "feedback": feedback_segments
         }
+        # Completed sessions no longer change: cache them until invalidated
+        ttl = FEEDBACK_CACHE_TTL if await session_store.is_active(session_id) else None
+        await cache_set(cache_key, result, ttl)
+        return result
     except Exception as e:
-        print(f"Error in get_feedback endpoint: {e}")
+        logger.error("Error in get_feedback endpoint: %s", e)
         return {
             "success": False,
             "message": str(e),
             "feedback": []
         }
 
-# Store active video recorders and feedback agents
+# Store active video recorders and feedback agents (objects are per-process;
+# which sessions are live, and where, is published through session_store)
 active_recorders: Dict[str, VideoRecorder] = {}
 active_feedback_agents: Dict[str, FeedbackAgent] = {}
 
@@ -155,41 +286,149 @@ active_feedback_agents: Dict[str, FeedbackAgent] = {}
 async def websocket_video_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time video frame processing with AI feedback"""
     await websocket.accept()
-    print("WebSocket connection established")
+    logger.info("WebSocket connection established")
+    
+    # Outbound messages are queued (as encoded bytes) and sent by one flusher
+    outbound: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+    flusher = asyncio.create_task(flush_outbound(websocket, outbound))
+    
+    def enqueue(payload: Union[Dict[str, Any], bytes]) -> None:
+        """Queue a message for the client; dicts are encoded with orjson"""
+        outbound.put_nowait(payload if isinstance(payload, bytes) else orjson.dumps(payload))
     
     # Generate unique session ID for this connection
     session_id = str(uuid.uuid4())
     video_recorder = None
     feedback_agent = None
     user_id = "anonymous"  # Default value
+    await session_store.start(session_id, user_id)
     
-    # Feedback collection buffers
-    frame_buffer: List[str] = []
-    audio_buffer: Optional[str] = None
+    # Feedback collection buffers (bounded: stale frames are evicted)
+    frame_buffer: Deque[bytes] = deque(maxlen=6)
+    audio_buffer: Optional[bytes] = None
     session_start_time = asyncio.get_event_loop().time()
     last_feedback_time = session_start_time
     feedback_segments: List[Dict[str, Any]] = []
     FEEDBACK_INTERVAL = 5.0  # seconds
     
+    # At most one AI analysis in flight per session
+    analysis_semaphore = asyncio.Semaphore(1)
+    feedback_tasks: Set[asyncio.Task] = set()
+    segments_lock = asyncio.Lock()
+    
+    def get_recorder() -> VideoRecorder:
+        """Return the session's recorder, creating it on the first media message"""
+        recorder = active_recorders.get(session_id)
+        if recorder is None:
+            recorder = VideoRecorder(session_id, user_id=user_id, fps=30)
+            active_recorders[session_id] = recorder
+            logger.info("Started recording for session %s, user %s", session_id, user_id)
+        return recorder
+    
+    async def generate_feedback(
+        frames: List[bytes],
+        audio_data: Optional[bytes],
+        segment_start: float,
+        segment_end: float,
+    ):
+        """Analyze one segment in a worker thread and push the result to the client"""
+        async with analysis_semaphore:
+            try:
+                ai_feedback = await asyncio.to_thread(
+                    feedback_agent.analyze_segment,
+                    frames=frames,
+                    audio_data=audio_data
+                )
+                
+                created_at = datetime.utcnow().isoformat() + "Z"
+
+                feedback_text = (ai_feedback or "").strip()
+                is_actionable = (
+                    bool(feedback_text)
+                    and feedback_text.upper() != "OK"
+                    and not feedback_text.lower().startswith("error")
+                )
+
+                payload: Dict[str, Any] = {
+                    "type": "ai_feedback",
+                    "message": ai_feedback,
+                    "timestamp": round(segment_end, 2),
+                    "session_id": session_id,
+                    "is_actionable": is_actionable,
+                }
+
+                if is_actionable:
+                    segment_entry = {
+                        "feedback_text": feedback_text,
+                        "start_seconds": round(segment_start, 2),
+                        "end_seconds": round(segment_end, 2),
+                        "created_at": created_at,
+                    }
+                    async with segments_lock:
+                        feedback_segments.append(segment_entry)
+                        segment_index = len(feedback_segments) - 1
+                    payload.update(
+                        {
+                            "start_seconds": segment_entry["start_seconds"],
+                            "end_seconds": segment_entry["end_seconds"],
+                            "created_at": created_at,
+                            "segment_index": segment_index,
+                        }
+                    )
+
+                # Send AI feedback to client
+                enqueue(payload)
+
+                if is_actionable:
+                    logger.info(
+                        "AI Feedback sent: %s (%ss-%ss)",
+                        feedback_text,
+                        payload['start_seconds'],
+                        payload['end_seconds'],
+                    )
+                else:
+                    logger.debug("AI Feedback (non-actionable): %s", ai_feedback)
+            except Exception as e:
+                logger.error("Error generating AI feedback: %s", e)
+    
     try:
         data_chunk_count = 0
         
         while True:
-            # Receive data from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # Receive data from client: binary media frames or JSON control messages
+            incoming = await websocket.receive()
+            if incoming["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(incoming.get("code", 1000))
+            
+            data = incoming.get("bytes")
+            if data == PING_MESSAGE or incoming.get("text") == PING_TEXT:
+                enqueue(PONG_MESSAGE)
+                continue
+            
+            if data is not None and data[:1] != b"{":
+                message = parse_binary_message(data)
+            else:
+                # JSON control envelopes may arrive as text or binary; orjson parses bytes directly
+                message = orjson.loads(data if data is not None else incoming["text"])
+                if message.get("type") in MEDIA_MESSAGE_TYPES:
+                    logger.warning(
+                        "Ignoring JSON %s message; media must be sent as binary frames",
+                        message.get("type"),
+                    )
+                    continue
             message_type = message.get("type")
             
             # Handle user authentication message
             if message_type == "auth":
                 user_id = message.get("user_id", "anonymous")
-                print(f"User authenticated: {user_id} for session {session_id}")
+                logger.info("User authenticated: %s for session %s", user_id, session_id)
+                await session_store.set_user(session_id, user_id)
                 
                 # Initialize feedback agent
                 feedback_agent = FeedbackAgent()
                 active_feedback_agents[session_id] = feedback_agent
                 
-                await websocket.send_json({
+                enqueue({
                     "type": "auth_success",
                     "session_id": session_id,
                     "message": "Authentication successful"
@@ -197,167 +436,110 @@ async def websocket_video_endpoint(websocket: WebSocket):
                 continue
             
             if message_type == "video_chunk":
-                if video_recorder is None:
-                    video_recorder = VideoRecorder(session_id, user_id=user_id, fps=30)
-                    active_recorders[session_id] = video_recorder
-                    print(f"Started recording for session {session_id}, user {user_id}")
+                video_recorder = get_recorder()
                 
                 # Video chunks are for recording only, not for AI analysis
                 data_chunk_count += 1
 
                 # Send status update
                 if data_chunk_count % 30 == 0:
-                    status = {
-                        "type": "status",
-                        "segments_processed": data_chunk_count,
-                        "message": "Recording...",
-                    }
-                    await websocket.send_json(status)
+                    enqueue(status_message(RECORDING_STATUS, data_chunk_count))
 
             elif message_type == "video_complete":
-                print(f"Received video_complete message for session {session_id}")
-                if video_recorder is None:
-                    video_recorder = VideoRecorder(session_id, user_id=user_id, fps=30)
-                    active_recorders[session_id] = video_recorder
-                    print(f"Started recording for session {session_id}, user {user_id}")
+                logger.debug("Received video_complete message for session %s", session_id)
+                video_recorder = get_recorder()
 
-                complete_data = message.get("data", "")
+                complete_data = message["data"]
                 if complete_data:
-                    print(f"Video data received: {len(complete_data)} characters")
-                    video_recorder.set_final_webm_blob(complete_data)
-                    await websocket.send_json(
+                    logger.debug("Video data received: %s bytes", len(complete_data))
+                    # Decoding and dumping a multi-MB blob blocks; do it in a worker thread
+                    await asyncio.to_thread(video_recorder.set_final_webm_blob, complete_data)
+                    enqueue(
                         {
                             "type": "status",
                             "message": "Final video received. Preparing upload…",
                         }
                     )
                 else:
-                    print("ERROR: No video data in video_complete message")
-                    await websocket.send_json(
+                    logger.error("No video data in video_complete message")
+                    enqueue(
                         {
                             "type": "upload_error",
                             "message": "No video data provided",
                         }
                     )
 
-            elif message_type == "frame":
+            elif message_type in ("frame", "frames"):
                 # Initialize video recorder and feedback agent on first frame
-                if video_recorder is None:
-                    video_recorder = VideoRecorder(session_id, user_id=user_id, fps=30)
-                    active_recorders[session_id] = video_recorder
-                    print(f"Started recording for session {session_id}, user {user_id}")
+                video_recorder = get_recorder()
                 
                 if feedback_agent is None:
                     feedback_agent = FeedbackAgent()
                     active_feedback_agents[session_id] = feedback_agent
-                    print(f"Started feedback agent for session {session_id}")
+                    logger.info("Started feedback agent for session %s", session_id)
                 
-                # Add frame to recorder
-                frame_data = message.get("data", "")
-                video_recorder.add_frame(frame_data)
+                # A "frames" message bundles several frames into one envelope
+                if message_type == "frames":
+                    frames = message["items"]
+                else:
+                    frames = [message["data"]]
                 
-                # Add frame to feedback buffer
-                frame_buffer.append(frame_data)
+                # Add frames to recorder (one decode-pool submission per message)
+                await video_recorder.add_frames_batch(frames)
                 
-                data_chunk_count += 1
+                # Add frames to feedback buffer
+                frame_buffer.extend(frames)
+                
+                previous_count = data_chunk_count
+                data_chunk_count += len(frames)
                 
                 # Check if it's time for AI feedback (every 5 seconds)
                 current_time = asyncio.get_event_loop().time()
-                if current_time - last_feedback_time >= FEEDBACK_INTERVAL:
-                    if frame_buffer:
-                        # Generate AI feedback in background to avoid blocking
-                        try:
-                            ai_feedback = feedback_agent.analyze_segment(
-                                frames=frame_buffer[-6:],  # Use last 6 frames (approx 0.2s at 30fps)
-                                audio_data=audio_buffer
-                            )
-                            
-                            current_offset = current_time - session_start_time
-                            segment_start = max(0.0, last_feedback_time - session_start_time)
-                            segment_end = max(segment_start, current_offset)
-                            created_at = datetime.utcnow().isoformat() + "Z"
-
-                            feedback_text = (ai_feedback or "").strip()
-                            is_actionable = (
-                                bool(feedback_text)
-                                and feedback_text.upper() != "OK"
-                                and not feedback_text.lower().startswith("error")
-                            )
-
-                            payload: Dict[str, Any] = {
-                                "type": "ai_feedback",
-                                "message": ai_feedback,
-                                "timestamp": round(segment_end, 2),
-                                "session_id": session_id,
-                                "is_actionable": is_actionable,
-                            }
-
-                            if is_actionable:
-                                segment_entry = {
-                                    "feedback_text": feedback_text,
-                                    "start_seconds": round(segment_start, 2),
-                                    "end_seconds": round(segment_end, 2),
-                                    "created_at": created_at,
-                                }
-                                feedback_segments.append(segment_entry)
-                                payload.update(
-                                    {
-                                        "start_seconds": segment_entry["start_seconds"],
-                                        "end_seconds": segment_entry["end_seconds"],
-                                        "created_at": created_at,
-                                        "segment_index": len(feedback_segments) - 1,
-                                    }
-                                )
-
-                            # Send AI feedback to client
-                            await websocket.send_json(payload)
-
-                            if is_actionable:
-                                print(
-                                    "AI Feedback sent:",
-                                    f"{feedback_text} ({payload['start_seconds']}s-{payload['end_seconds']}s)",
-                                )
-                            else:
-                                print(f"AI Feedback (non-actionable): {ai_feedback}")
-                        except Exception as e:
-                            print(f"Error generating AI feedback: {e}")
-                        
-                        # Clear buffers and reset timer
-                        frame_buffer.clear()
-                        audio_buffer = None
-                        last_feedback_time = current_time
+                # While a previous analysis is still in flight, keep collecting the
+                # freshest frames and retry on the next one instead of queueing work
+                if (
+                    current_time - last_feedback_time >= FEEDBACK_INTERVAL
+                    and frame_buffer
+                    and not analysis_semaphore.locked()
+                ):
+                    segment_start = max(0.0, last_feedback_time - session_start_time)
+                    segment_end = max(segment_start, current_time - session_start_time)
+                    task = asyncio.create_task(
+                        generate_feedback(list(frame_buffer), audio_buffer, segment_start, segment_end)
+                    )
+                    feedback_tasks.add(task)
+                    task.add_done_callback(feedback_tasks.discard)
+                    
+                    # Reset timer; the frame deque evicts old frames on its own
+                    audio_buffer = None
+                    last_feedback_time = current_time
                 
-                # Send status acknowledgment
-                if data_chunk_count % 60 == 0:
-                    status = {
-                        "type": "status",
-                        "segments_processed": data_chunk_count,
-                        "message": "Processing..."
-                    }
-                    await websocket.send_json(status)
+                # Send status acknowledgment (batches may step over a multiple of 60)
+                if data_chunk_count // 60 > previous_count // 60:
+                    enqueue(status_message(PROCESSING_STATUS, data_chunk_count))
                     
             elif message_type == "audio":
-                print(f"Received audio chunk for session {session_id}")
+                logger.debug("Received audio chunk for session %s", session_id)
                 # Handle audio chunks
-                if video_recorder is None:
-                    video_recorder = VideoRecorder(session_id, user_id=user_id, fps=30)
-                    active_recorders[session_id] = video_recorder
-                    print(f"Started recording for session {session_id}, user {user_id}")
+                video_recorder = get_recorder()
                 
                 # Add audio chunk to recorder
-                audio_data = message.get("data", "")
-                video_recorder.add_audio_chunk(audio_data)
+                audio_data = message["data"]
+                await video_recorder.add_audio_chunk(audio_data)
                 
                 # Store latest audio for feedback
                 audio_buffer = audio_data
                     
             elif message_type == "stop":
                 # Handle stop recording request
-                print(f"Stop recording request received for session {session_id}")
+                logger.info("Stop recording request received for session %s", session_id)
                 
                 if video_recorder:
-                    print(f"Video recorder exists, has_combined_blob: {video_recorder.has_combined_blob}")
-                    await websocket.send_json(
+                    logger.debug(
+                        "Video recorder exists, has_combined_blob: %s",
+                        video_recorder.has_combined_blob,
+                    )
+                    enqueue(
                         {
                             "type": "status",
                             "message": "Processing recording…",
@@ -365,26 +547,28 @@ async def websocket_video_endpoint(websocket: WebSocket):
                     )
 
                     # Save video to disk
-                    video_path = video_recorder.save_video()
-                    print(f"Video save result: {video_path}")
+                    # Finalizing/transcoding blocks; keep other sessions responsive
+                    video_path = await asyncio.to_thread(video_recorder.save_video)
+                    logger.debug("Video save result: %s", video_path)
                     
                     if video_path:
-                        print(f"Uploading video to Supabase: {video_path}")
+                        logger.info("Uploading video to Supabase: %s", video_path)
                         # Upload to Supabase
                         public_url = await upload_to_supabase(video_path, session_id, user_id)
                         
                         if public_url:
-                            print(f"Upload successful: {public_url}")
+                            logger.info("Upload successful: %s", public_url)
+                            await cache_delete(videos_cache_key(user_id))
                             # Send success response with video URL
-                            await websocket.send_json({
+                            enqueue({
                                 "type": "upload_complete",
                                 "url": public_url,
                                 "message": "Video uploaded successfully",
                                 "session_id": session_id,
                             })
                         else:
-                            print("Upload to Supabase failed")
-                            await websocket.send_json({
+                            logger.error("Upload to Supabase failed")
+                            enqueue({
                                 "type": "upload_error",
                                 "message": "Failed to upload video to Supabase",
                                 "session_id": session_id,
@@ -393,8 +577,8 @@ async def websocket_video_endpoint(websocket: WebSocket):
                         # Cleanup temporary file
                         video_recorder.cleanup()
                     else:
-                        print("Failed to save video - no video path returned")
-                        await websocket.send_json({
+                        logger.error("Failed to save video - no video path returned")
+                        enqueue({
                             "type": "upload_error",
                             "message": "Failed to save video"
                         })
@@ -403,29 +587,40 @@ async def websocket_video_endpoint(websocket: WebSocket):
                     if session_id in active_recorders:
                         del active_recorders[session_id]
                 else:
-                    print(f"No video recorder found for session {session_id}")
+                    logger.warning("No video recorder found for session %s", session_id)
+                
+                # Let in-flight analyses finish so their segments are persisted
+                if feedback_tasks:
+                    await asyncio.gather(*feedback_tasks, return_exceptions=True)
+                
+                async with segments_lock:
+                    segments_to_save = list(feedback_segments)
+                    feedback_segments.clear()
                 
                 # Persist AI feedback segments to Supabase
                 try:
                     save_result = await save_feedback_segments_to_supabase(
                         session_id=session_id,
                         user_id=user_id,
-                        segments=feedback_segments,
+                        segments=segments_to_save,
                     )
 
                     if save_result.get("success"):
-                        await websocket.send_json(
+                        await cache_delete(feedback_cache_key(session_id))
+                        enqueue(
                             {
                                 "type": "feedback_saved",
                                 "session_id": session_id,
                                 "segments_saved": save_result.get("count", 0),
                             }
                         )
-                        print(
-                            f"Saved {save_result.get('count', 0)} feedback segments for session {session_id}"
+                        logger.info(
+                            "Saved %s feedback segments for session %s",
+                            save_result.get('count', 0),
+                            session_id,
                         )
                     else:
-                        await websocket.send_json(
+                        enqueue(
                             {
                                 "type": "feedback_save_error",
                                 "session_id": session_id,
@@ -434,21 +629,21 @@ async def websocket_video_endpoint(websocket: WebSocket):
                                 ),
                             }
                         )
-                        print(
-                            f"Failed to save feedback segments for session {session_id}: {save_result.get('error')}"
+                        logger.error(
+                            "Failed to save feedback segments for session %s: %s",
+                            session_id,
+                            save_result.get('error'),
                         )
                 except Exception as e:
                     error_text = str(e)
-                    await websocket.send_json(
+                    enqueue(
                         {
                             "type": "feedback_save_error",
                             "session_id": session_id,
                             "message": error_text,
                         }
                     )
-                    print(f"Exception while saving feedback segments: {error_text}")
-
-                feedback_segments.clear()
+                    logger.error("Exception while saving feedback segments: %s", error_text)
 
                 # Cleanup feedback agent
                 if session_id in active_feedback_agents:
@@ -458,10 +653,12 @@ async def websocket_video_endpoint(websocket: WebSocket):
                     
             elif message_type == "ping":
                 # Respond to ping messages to keep connection alive
-                await websocket.send_json({"type": "pong"})
+                enqueue(PONG_MESSAGE)
                 
     except WebSocketDisconnect:
-        print(f"WebSocket connection closed for session {session_id}")
+        logger.info("WebSocket connection closed for session %s", session_id)
+        for task in feedback_tasks:
+            task.cancel()
         # Cleanup recorder if connection closed unexpectedly
         if session_id in active_recorders:
             active_recorders[session_id].cleanup()
@@ -470,7 +667,9 @@ async def websocket_video_endpoint(websocket: WebSocket):
         if session_id in active_feedback_agents:
             del active_feedback_agents[session_id]
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.error("WebSocket error: %s", e)
+        for task in feedback_tasks:
+            task.cancel()
         # Cleanup recorder on error
         if session_id in active_recorders:
             active_recorders[session_id].cleanup()
@@ -479,8 +678,33 @@ async def websocket_video_endpoint(websocket: WebSocket):
         if session_id in active_feedback_agents:
             del active_feedback_agents[session_id]
         await websocket.close()
+    finally:
+        await session_store.end(session_id)
+        
+        # Flush anything still queued, then stop the flusher
+        outbound.put_nowait(None)
+        try:
+            await flusher
+        except Exception as e:
+            logger.error("Error flushing outbound messages: %s", e)
 
 # Run the server
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    # libuv event loop + C HTTP parser for the WebSocket-heavy workload;
+    # uvloop has no Windows build, so fall back to the stock asyncio loop there
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop=loop,
+        http="httptools",
+        ws="websockets",
+    )
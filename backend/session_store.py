@@ -0,0 +1,81 @@
+import logging
+from datetime import datetime
+from typing import Set
+from cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Live sessions expire on their own if a worker dies without ending them
+SESSION_TTL = 6 * 60 * 60
+
+
+def session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+class SessionStore:
+    """
+    Registry of live WebSocket sessions shared by all workers through Redis
+
+    The recorder and feedback agent objects stay in the owning process; only
+    session metadata (user, start time) is published. Without
+    Redis the registry is local to this process.
+    """
+
+    def __init__(self):
+        self._local: Set[str] = set()
+
+    async def start(self, session_id: str, user_id: str) -> None:
+        """Register a new session owned by this worker"""
+        self._local.add(session_id)
+        if not redis_client:
+            return
+
+        try:
+            key = session_key(session_id)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={
+                    "user_id": user_id,
+                    "started_at": datetime.utcnow().isoformat() + "Z",
+                })
+                pipe.expire(key, SESSION_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.error("Error registering session %s: %s", session_id, e)
+
+    async def set_user(self, session_id: str, user_id: str) -> None:
+        """Record the authenticated user for a session"""
+        if not redis_client:
+            return
+
+        try:
+            await redis_client.hset(session_key(session_id), "user_id", user_id)
+        except Exception as e:
+            logger.error("Error updating session %s: %s", session_id, e)
+
+    async def end(self, session_id: str) -> None:
+        """Remove a finished or disconnected session"""
+        self._local.discard(session_id)
+        if not redis_client:
+            return
+
+        try:
+            await redis_client.delete(session_key(session_id))
+        except Exception as e:
+            logger.error("Error ending session %s: %s", session_id, e)
+
+    async def is_active(self, session_id: str) -> bool:
+        """Whether the session is live on any worker"""
+        if session_id in self._local:
+            return True
+        if not redis_client:
+            return False
+
+        try:
+            return bool(await redis_client.exists(session_key(session_id)))
+        except Exception as e:
+            logger.error("Error reading session %s: %s", session_id, e)
+            return False
+
+
+session_store = SessionStore()
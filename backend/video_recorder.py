@@ -1,21 +1,25 @@
 import os
 import asyncio
+import atexit
 import cv2
 import numpy as np
-from PIL import Image
-import base64
-from io import BytesIO
+import logging
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import subprocess
 import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
@@ -25,6 +29,142 @@ supabase: Optional[Client] = None
 if supabase_url and supabase_key:
     supabase = create_client(supabase_url, supabase_key)
 
+# Rows per bulk insert when persisting feedback segments
+FEEDBACK_INSERT_BATCH_SIZE = 500
+
+# Encoder pipe writes and fallback frame decoding run here. cv2.imdecode and
+# pipe writes release the GIL, so sessions proceed in parallel off the event loop.
+_DECODE_POOL = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4,
+    thread_name_prefix="media-decode",
+)
+atexit.register(_DECODE_POOL.shutdown)
+
+# H.264 encoder settings for the WebM -> MP4 transcode: NVENC (GPU) when the
+# ffmpeg build has it, libx264 otherwise
+NVENC_VIDEO_ARGS = [
+    "-c:v", "h264_nvenc",
+    "-preset", "p4",
+    "-tune", "ll",
+    "-rc", "vbr",
+    "-cq", "23",
+    "-spatial_aq", "1",
+    "-temporal_aq", "1",
+    "-profile:v", "high",
+]
+X264_VIDEO_ARGS = [
+    "-c:v", "libx264",
+    "-preset", "veryfast",
+    "-crf", "23",
+    "-pix_fmt", "yuv420p",
+]
+
+
+# Lines of ffmpeg stderr kept for error reports
+FFMPEG_STDERR_TAIL_LINES = 64
+
+
+def run_ffmpeg(cmd: List[str]) -> None:
+    """
+    Run an ffmpeg command to completion, keeping only the tail of its stderr
+    
+    Args:
+        cmd: Full ffmpeg command line
+    
+    Raises:
+        subprocess.CalledProcessError: On a non-zero exit, with the stderr tail
+            (decoded) as ``stderr``
+        FileNotFoundError: If ffmpeg is not installed
+    """
+    # -nostats drops the \r-terminated progress line, which would otherwise
+    # arrive as one ever-growing "line" and defeat the bounded tail below
+    cmd = [cmd[0], "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # stdout is discarded, so draining stderr here cannot deadlock; the bounded
+    # deque keeps only the last newline-terminated log lines
+    with proc.stderr:
+        tail = deque(proc.stderr, maxlen=FFMPEG_STDERR_TAIL_LINES)
+    returncode = proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(
+            returncode,
+            cmd,
+            stderr=b"".join(tail).decode("utf-8", errors="replace"),
+        )
+
+
+@lru_cache(maxsize=1)
+def has_nvenc() -> bool:
+    """Whether the installed ffmpeg exposes the h264_nvenc encoder (checked once)"""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
+    return "h264_nvenc" in result.stdout
+
+
+def decode_frame_image(image_data: bytes) -> np.ndarray:
+    """Decode a compressed frame image straight to a BGR array"""
+    frame = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode frame image")
+    return frame
+
+
+# Matroska/WebM: EBML magic, and the CodecID strings looked for in the Tracks
+# element (which MediaRecorder writes within the first few hundred bytes)
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+WEBM_SNIFF_BYTES = 64 * 1024
+WEBM_CODEC_IDS = (
+    b"V_MPEG4/ISO/AVC",
+    b"V_VP8",
+    b"V_VP9",
+    b"V_AV1",
+    b"A_AAC",
+    b"A_OPUS",
+    b"A_VORBIS",
+)
+
+
+def sniff_webm_codecs(path: str) -> Set[bytes]:
+    """
+    Return the known codec IDs found in a WebM file's header
+    
+    Reads only the first WEBM_SNIFF_BYTES; an empty set means the file is
+    not Matroska or its tracks could not be found there.
+    """
+    with open(path, "rb") as f:
+        head = f.read(WEBM_SNIFF_BYTES)
+    if not head.startswith(EBML_MAGIC):
+        return set()
+    return {codec_id for codec_id in WEBM_CODEC_IDS if head.find(codec_id) != -1}
+
+
+def probe_video_codec(path: str) -> Optional[str]:
+    """Return the codec name of a file's first video stream (e.g. "h264", "vp8"), or None"""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=codec_name",
+                "-of", "csv=p=0",
+                path,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
 
 class VideoRecorder:
     """Handles video and audio recording from WebSocket frames"""
@@ -33,7 +173,6 @@ class VideoRecorder:
         self.session_id = session_id
         self.user_id = user_id
         self.fps = fps
-        self.frames: List[np.ndarray] = []
         self.audio_chunks: List[bytes] = []
         
         # Create user-specific directory structure
@@ -42,6 +181,7 @@ class VideoRecorder:
         
         self.temp_video_path = f"{self.user_session_dir}/video.mp4"
         self.temp_audio_path = f"{self.user_session_dir}/audio.webm"
+        self.temp_encoded_audio_path = f"{self.user_session_dir}/audio.m4a"
         self.temp_combined_video_path = f"{self.user_session_dir}/combined.webm"
         self.final_video_path = f"{self.user_session_dir}/final.mp4"
         self.has_combined_blob = False
@@ -49,105 +189,332 @@ class VideoRecorder:
         # Audio properties (will be set when first audio chunk arrives)
         self.audio_sample_rate = 48000  # Default for WebM
         self.audio_channels = 1  # Mono
+        
+        # ffmpeg processes encoding streamed frames / audio (started on the
+        # first frame / audio chunk)
+        self._frame_pipe: Optional[subprocess.Popen] = None
+        self._audio_pipe: Optional[subprocess.Popen] = None
+        self._ffmpeg_unavailable = False
+        # Set once the frame encoder dies; later frames go to _frame_store
+        self._frame_pipe_failed = False
+        # First audio chunk (carries the WebM header), kept so a dead audio
+        # encoder can fall back to buffering chunks into a decodable file
+        self._audio_header: Optional[bytes] = None
+        
+        # Without ffmpeg, decoded frames live in one contiguous (N, H, W, 3)
+        # array filled up to _frame_count instead of a list of per-frame arrays
+        self._frame_store: Optional[np.ndarray] = None
+        self._frame_count = 0
+    
+    def _next_frame_slot(self, shape: tuple) -> np.ndarray:
+        """
+        Return the store slot for the next decoded frame
+        
+        The store is allocated on the first frame (10 seconds' worth) and
+        doubled when full, so appends stay amortized O(1).
+        """
+        if self._frame_store is None:
+            self._frame_store = np.empty((self.fps * 10, *shape), dtype=np.uint8)
+        elif shape != self._frame_store.shape[1:]:
+            raise ValueError(
+                f"Frame size changed from {self._frame_store.shape[1:]} to {shape}"
+            )
+        elif self._frame_count == len(self._frame_store):
+            grown = np.empty((len(self._frame_store) * 2, *shape), dtype=np.uint8)
+            grown[:self._frame_count] = self._frame_store
+            self._frame_store = grown
+        return self._frame_store[self._frame_count]
+    
+    def _start_frame_pipe(self) -> Optional[subprocess.Popen]:
+        """Spawn an ffmpeg process that encodes piped images into temp_video_path"""
+        try:
+            return subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-f",
+                    "image2pipe",
+                    "-framerate",
+                    str(self.fps),
+                    "-i",
+                    "-",
+                    # libx264 + yuv420p needs even dimensions
+                    "-vf",
+                    "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+                    # Keep up with live capture; encoding overlaps the session
+                    "-c:v",
+                    "libx264",
+                    "-preset",
+                    "ultrafast",
+                    "-tune",
+                    "zerolatency",
+                    "-pix_fmt",
+                    "yuv420p",
+                    # Fragmented MP4: the moov is written up front and each
+                    # keyframe closes a fragment, so finishing needs no
+                    # faststart rewrite and a killed encoder leaves a playable file
+                    "-movflags",
+                    "+frag_keyframe+empty_moov+default_base_moof",
+                    self.temp_video_path,
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logger.warning("FFmpeg not found. Buffering decoded frames in memory instead.")
+            return None
+    
+    def _start_audio_pipe(self) -> Optional[subprocess.Popen]:
+        """Spawn an ffmpeg process that encodes piped WebM audio into temp_encoded_audio_path"""
+        try:
+            return subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-f",
+                    "webm",
+                    "-i",
+                    "pipe:0",
+                    "-vn",
+                    "-c:a",
+                    "aac",
+                    "-b:a",
+                    "160k",
+                    self.temp_encoded_audio_path,
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logger.warning("FFmpeg not found. Buffering audio chunks in memory instead.")
+            return None
     
-    def add_frame(self, base64_frame: str):
-        """Add a frame to the recording"""
+    @staticmethod
+    def _finish_pipe(proc: subprocess.Popen) -> bool:
+        """Close a streaming encoder's input and report whether ffmpeg succeeded"""
         try:
-            # Remove data URL prefix if present
-            if "base64," in base64_frame:
-                base64_frame = base64_frame.split("base64,")[1]
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        return proc.wait() == 0
+    
+    @staticmethod
+    def _kill_pipe(proc: subprocess.Popen) -> None:
+        """Stop a streaming encoder and reap it"""
+        proc.kill()
+        proc.wait()
+    
+    async def add_frames_batch(self, frames: List[bytes]):
+        """
+        Add frames (encoded image bytes) to the recording
+        
+        The whole batch is decoded / written to the encoder in one decode-pool
+        submission; the recorder's own state is only touched here, on the
+        awaiting coroutine. A frame that fails is logged and skipped.
+        """
+        if not frames:
+            return
+        
+        if self.has_combined_blob:
+            # The final blob is what gets saved; frames would only be discarded
+            return
+        
+        loop = asyncio.get_running_loop()
+        try:
+            if self._frame_pipe is None and not self._ffmpeg_unavailable and not self._frame_pipe_failed:
+                self._frame_pipe = await loop.run_in_executor(_DECODE_POOL, self._start_frame_pipe)
+                self._ffmpeg_unavailable = self._frame_pipe is None
             
-            # Decode base64 to image
-            image_data = base64.b64decode(base64_frame)
-            image = Image.open(BytesIO(image_data))
+            pipe = self._frame_pipe
             
-            # Convert PIL Image to OpenCV format (BGR)
-            frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            def process_frames() -> Tuple[List[np.ndarray], bool]:
+                decoded = []
+                broken = False
+                for frame in frames:
+                    try:
+                        if pipe is not None and not broken:
+                            try:
+                                # Stream the still-compressed image straight to the encoder
+                                pipe.stdin.write(frame)
+                                continue
+                            except OSError as e:
+                                logger.warning("FFmpeg frame encoder failed (%s). Buffering decoded frames instead.", e)
+                                broken = True
+                        # No (working) ffmpeg: decode (straight to BGR) for cv2.VideoWriter
+                        decoded.append(decode_frame_image(frame))
+                    except Exception as e:
+                        logger.error("Error adding frame: %s", e)
+                return decoded, broken
             
-            self.frames.append(frame)
+            decoded, broken = await loop.run_in_executor(_DECODE_POOL, process_frames)
+            if broken:
+                # Never respawn: a fresh encoder would overwrite temp_video_path
+                # and the frames fed to the dead one are gone either way
+                self._frame_pipe = None
+                self._frame_pipe_failed = True
+                await loop.run_in_executor(_DECODE_POOL, self._kill_pipe, pipe)
+            for frame in decoded:
+                self._next_frame_slot(frame.shape)[...] = frame
+                self._frame_count += 1
         except Exception as e:
-            print(f"Error adding frame: {e}")
+            logger.error("Error adding frames: %s", e)
     
-    def add_audio_chunk(self, base64_audio: str):
-        """Add an audio chunk to the recording"""
+    async def add_audio_chunk(self, audio_data: bytes):
+        """Add an audio chunk (WebM bytes) to the recording"""
+        if self.has_combined_blob:
+            return
+        
+        loop = asyncio.get_running_loop()
         try:
-            # Remove data URL prefix if present
-            if "base64," in base64_audio:
-                base64_audio = base64_audio.split("base64,")[1]
+            if self._audio_pipe is None and not self._ffmpeg_unavailable and not self.audio_chunks:
+                self._audio_pipe = await loop.run_in_executor(_DECODE_POOL, self._start_audio_pipe)
+                self._ffmpeg_unavailable = self._audio_pipe is None
+            
+            if self._audio_pipe is not None:
+                if self._audio_header is None:
+                    self._audio_header = audio_data
+                try:
+                    # Encode to AAC while the session is still running
+                    await loop.run_in_executor(_DECODE_POOL, self._audio_pipe.stdin.write, audio_data)
+                    return
+                except OSError as e:
+                    logger.warning("FFmpeg audio encoder failed (%s). Buffering audio chunks instead.", e)
+                    audio_pipe, self._audio_pipe = self._audio_pipe, None
+                    await loop.run_in_executor(_DECODE_POOL, self._kill_pipe, audio_pipe)
+                    # Buffered chunks never respawn the encoder; lead with the
+                    # header so the saved WebM still decodes
+                    if self._audio_header is not audio_data:
+                        self.audio_chunks.append(self._audio_header)
             
-            # Decode base64 to audio data
-            audio_data = base64.b64decode(base64_audio)
+            # No (working) ffmpeg: keep the chunks and write them out at save time
             self.audio_chunks.append(audio_data)
         except Exception as e:
-            print(f"Error adding audio chunk: {e}")
+            logger.error("Error adding audio chunk: %s", e)
 
-    def set_final_webm_blob(self, base64_blob: str):
+    def set_final_webm_blob(self, blob_data: bytes):
         """Store the complete WebM blob received at the end of the session"""
         try:
-            if "base64," in base64_blob:
-                base64_blob = base64_blob.split("base64,")[1]
-
-            blob_data = base64.b64decode(base64_blob)
             with open(self.temp_combined_video_path, "wb") as f:
                 f.write(blob_data)
 
             self.has_combined_blob = True
-            print(f"Stored final WebM blob for session {self.session_id}")
+            logger.info("Stored final WebM blob for session %s", self.session_id)
+            
+            # save_video converts the blob; the live encoders' output is unused
+            for proc in (self._frame_pipe, self._audio_pipe):
+                if proc is not None:
+                    self._kill_pipe(proc)
+            self._frame_pipe = None
+            self._audio_pipe = None
         except Exception as e:
-            print(f"Error storing WebM blob: {e}")
+            logger.error("Error storing WebM blob: %s", e)
             self.has_combined_blob = False
     
+    def _transcode_command(self, nvenc: bool) -> List[str]:
+        """Build the ffmpeg command converting the final WebM blob to MP4"""
+        # With NVENC, decode on the GPU too so frames never leave VRAM
+        input_args = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] if nvenc else []
+        video_args = NVENC_VIDEO_ARGS if nvenc else X264_VIDEO_ARGS
+        return [
+            "ffmpeg",
+            "-y",
+            "-fflags",
+            "+genpts",
+            *input_args,
+            "-i",
+            self.temp_combined_video_path,
+            "-vsync",
+            "2",
+            *video_args,
+            "-r",
+            str(self.fps),
+            "-c:a",
+            "aac",
+            "-b:a",
+            "160k",
+            "-ar",
+            str(self.audio_sample_rate),
+            "-ac",
+            str(self.audio_channels),
+            "-af",
+            "aresample=async=1:first_pts=0",
+            "-movflags",
+            "+faststart",
+            "-shortest",
+            self.final_video_path,
+        ]
+    
+    def _remux_command(self, copy_audio: bool) -> List[str]:
+        """Build the ffmpeg command copying the final blob's H.264 video into MP4"""
+        if copy_audio:
+            # AAC is already MP4-compatible; audio filters can't run on a copy
+            audio_args = ["-c:a", "copy"]
+        else:
+            audio_args = [
+                "-c:a",
+                "aac",
+                "-b:a",
+                "160k",
+                "-ar",
+                str(self.audio_sample_rate),
+                "-ac",
+                str(self.audio_channels),
+                "-af",
+                "aresample=async=1:first_pts=0",
+            ]
+        return [
+            "ffmpeg",
+            "-y",
+            "-fflags",
+            "+genpts",
+            "-i",
+            self.temp_combined_video_path,
+            "-c:v",
+            "copy",
+            *audio_args,
+            "-movflags",
+            "+faststart",
+            "-shortest",
+            self.final_video_path,
+        ]
+    
     def save_video(self) -> Optional[str]:
         """Save recorded frames and audio as a video file"""
         if self.has_combined_blob:
             try:
-                ffmpeg_cmd = [
-                    "ffmpeg",
-                    "-y",
-                    "-fflags",
-                    "+genpts",
-                    "-i",
-                    self.temp_combined_video_path,
-                    "-vsync",
-                    "2",
-                    "-c:v",
-                    "libx264",
-                    "-preset",
-                    "veryfast",
-                    "-crf",
-                    "23",
-                    "-r",
-                    str(self.fps),
-                    "-pix_fmt",
-                    "yuv420p",
-                    "-c:a",
-                    "aac",
-                    "-b:a",
-                    "160k",
-                    "-ar",
-                    str(self.audio_sample_rate),
-                    "-ac",
-                    str(self.audio_channels),
-                    "-af",
-                    "aresample=async=1:first_pts=0",
-                    "-movflags",
-                    "+faststart",
-                    "-shortest",
-                    self.final_video_path,
-                ]
-
-                subprocess.run(
-                    ffmpeg_cmd,
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                )
-                print(f"Converted WebM blob to MP4: {self.final_video_path}")
+                # Browser already produced H.264: copy the stream, no re-encode.
+                # A header sniff answers this without spawning ffprobe.
+                codec_ids = sniff_webm_codecs(self.temp_combined_video_path)
+                if codec_ids:
+                    is_h264 = b"V_MPEG4/ISO/AVC" in codec_ids
+                else:
+                    is_h264 = probe_video_codec(self.temp_combined_video_path) in ("h264", "avc1")
+                
+                if is_h264:
+                    try:
+                        run_ffmpeg(self._remux_command(copy_audio=b"A_AAC" in codec_ids))
+                        logger.info("Remuxed H.264 WebM blob to MP4: %s", self.final_video_path)
+                        return self.final_video_path
+                    except subprocess.CalledProcessError as e:
+                        logger.warning("H.264 stream copy failed, re-encoding: %s", e.stderr)
+
+                if has_nvenc():
+                    try:
+                        run_ffmpeg(self._transcode_command(nvenc=True))
+                        logger.info("Converted WebM blob to MP4 with NVENC: %s", self.final_video_path)
+                        return self.final_video_path
+                    except subprocess.CalledProcessError as e:
+                        # Listed encoder but no usable GPU/driver: use libx264
+                        logger.warning("NVENC conversion failed, retrying with libx264: %s", e.stderr)
+
+                run_ffmpeg(self._transcode_command(nvenc=False))
+                logger.info("Converted WebM blob to MP4: %s", self.final_video_path)
                 return self.final_video_path
             except subprocess.CalledProcessError as e:
-                print(f"FFmpeg conversion error (primary pipeline): {e.stderr}")
-                print("Attempting simplified fallback conversion…")
-
+                logger.error("FFmpeg conversion error (primary pipeline): %s", e.stderr)
+                logger.warning("Attempting simplified fallback conversion…")
                 fallback_cmd = [
                     "ffmpeg",
                     "-y",
@@ -169,124 +536,142 @@ class VideoRecorder:
                 ]
 
                 try:
-                    subprocess.run(
-                        fallback_cmd,
-                        check=True,
-                        capture_output=True,
-                        text=True,
-                    )
-                    print(
-                        f"Fallback FFmpeg conversion succeeded: {self.final_video_path}"
-                    )
+                    run_ffmpeg(fallback_cmd)
+                    logger.info("Fallback FFmpeg conversion succeeded: %s", self.final_video_path)
                     return self.final_video_path
                 except subprocess.CalledProcessError as fallback_error:
-                    print(
-                        f"Fallback FFmpeg conversion failed: {fallback_error.stderr}"
-                    )
+                    logger.error("Fallback FFmpeg conversion failed: %s", fallback_error.stderr)
                     return None
             except FileNotFoundError:
-                print("FFmpeg not found. Cannot convert WebM to MP4.")
-                print("Install FFmpeg: brew install ffmpeg (on macOS)")
+                logger.warning("FFmpeg not found. Cannot convert WebM to MP4.")
+                logger.warning("Install FFmpeg: brew install ffmpeg (on macOS)")
                 return None
             except Exception as e:
-                print(f"Error converting WebM blob: {e}")
+                logger.error("Error converting WebM blob: %s", e)
                 return None
 
-        if not self.frames:
-            print("No frames to save")
+        if self._frame_pipe is None and not self._frame_count:
+            logger.warning("No frames to save")
             return None
         
         try:
-            # Save video frames
-            height, width, _ = self.frames[0].shape
-            
-            # Use H.264 codec for better compatibility
-            fourcc = cv2.VideoWriter_fourcc(*'avc1')
-            video_writer = cv2.VideoWriter(
-                self.temp_video_path,
-                fourcc,
-                self.fps,
-                (width, height)
-            )
-            
-            # Write all frames
-            for frame in self.frames:
-                video_writer.write(frame)
+            if self._frame_pipe is not None:
+                # Frames were encoded as they arrived; just let ffmpeg finish
+                frame_pipe, self._frame_pipe = self._frame_pipe, None
+                if not self._finish_pipe(frame_pipe):
+                    logger.error("FFmpeg frame encoding failed")
+                    return None
+                logger.info("Video frames encoded to %s", self.temp_video_path)
+            else:
+                # Save video frames
+                height, width = self._frame_store.shape[1:3]
+                
+                # Use H.264 codec for better compatibility
+                fourcc = cv2.VideoWriter_fourcc(*'avc1')
+                video_writer = cv2.VideoWriter(
+                    self.temp_video_path,
+                    fourcc,
+                    self.fps,
+                    (width, height)
+                )
+                
+                # Write all frames
+                for frame in self._frame_store[:self._frame_count]:
+                    video_writer.write(frame)
+                
+                video_writer.release()
+                logger.info("Video frames saved to %s", self.temp_video_path)
             
-            video_writer.release()
-            print(f"Video frames saved to {self.temp_video_path}")
+            audio_path = None
+            audio_codec = "aac"
+            if self._audio_pipe is not None:
+                # Audio was encoded as it arrived; both streams can be copied
+                audio_pipe, self._audio_pipe = self._audio_pipe, None
+                if self._finish_pipe(audio_pipe):
+                    audio_path = self.temp_encoded_audio_path
+                    audio_codec = "copy"
+                    logger.info("Audio encoded to %s", audio_path)
+                else:
+                    logger.error("FFmpeg audio encoding failed")
+            elif self.audio_chunks:
+                # Save audio chunks to file (one buffered pass, no joined copy)
+                with open(self.temp_audio_path, 'wb', buffering=1 << 20) as f:
+                    f.writelines(self.audio_chunks)
+                audio_path = self.temp_audio_path
+                logger.info("Audio saved to %s", audio_path)
             
-            # If we have audio chunks, save them and combine with video
-            if self.audio_chunks:
-                # Save audio chunks to file
-                with open(self.temp_audio_path, 'wb') as f:
-                    for chunk in self.audio_chunks:
-                        f.write(chunk)
-                print(f"Audio saved to {self.temp_audio_path}")
-                
+            # If we have audio, combine it with the video
+            if audio_path:
                 # Combine video and audio using FFmpeg
                 try:
-                    subprocess.run([
+                    run_ffmpeg([
                         'ffmpeg',
                         '-i', self.temp_video_path,
-                        '-i', self.temp_audio_path,
+                        '-i', audio_path,
                         '-c:v', 'copy',
-                        '-c:a', 'aac',
+                        '-c:a', audio_codec,
                         '-y',
                         self.final_video_path
-                    ], check=True, capture_output=True, text=True)
-                    print(f"Combined video with audio: {self.final_video_path}")
+                    ])
+                    logger.info("Combined video with audio: %s", self.final_video_path)
                     return self.final_video_path
                 except subprocess.CalledProcessError as e:
-                    print(f"FFmpeg error: {e.stderr}")
-                    print("Returning video without audio")
+                    logger.error("FFmpeg error: %s", e.stderr)
+                    logger.warning("Returning video without audio")
                     return self.temp_video_path
                 except FileNotFoundError:
-                    print("FFmpeg not found. Returning video without audio.")
-                    print("Install FFmpeg: brew install ffmpeg (on macOS)")
+                    logger.warning("FFmpeg not found. Returning video without audio.")
+                    logger.warning("Install FFmpeg: brew install ffmpeg (on macOS)")
                     return self.temp_video_path
             else:
                 # No audio, return video only
                 return self.temp_video_path
                 
         except Exception as e:
-            print(f"Error saving video: {e}")
+            logger.error("Error saving video: %s", e)
             return None
     
     def cleanup(self):
         """Clean up temporary files"""
         try:
-            if os.path.exists(self.temp_video_path):
-                os.remove(self.temp_video_path)
-                print(f"Cleaned up {self.temp_video_path}")
-            if os.path.exists(self.temp_audio_path):
-                os.remove(self.temp_audio_path)
-                print(f"Cleaned up {self.temp_audio_path}")
-            if os.path.exists(self.temp_combined_video_path):
-                os.remove(self.temp_combined_video_path)
-                print(f"Cleaned up {self.temp_combined_video_path}")
-            if os.path.exists(self.final_video_path):
-                os.remove(self.final_video_path)
-                print(f"Cleaned up {self.final_video_path}")
+            # Stop encoders left running by an aborted session
+            for proc in (self._frame_pipe, self._audio_pipe):
+                if proc is not None:
+                    self._kill_pipe(proc)
+            self._frame_pipe = None
+            self._audio_pipe = None
             
-            # Remove the session directory if empty
-            if os.path.exists(self.user_session_dir) and not os.listdir(self.user_session_dir):
+            # Everything the recorder writes lives in its session directory:
+            # one directory read instead of an exists/remove pair per file
+            try:
+                with os.scandir(self.user_session_dir) as entries:
+                    for entry in entries:
+                        try:
+                            os.unlink(entry.path)
+                            logger.debug("Cleaned up %s", entry.path)
+                        except FileNotFoundError:
+                            pass
                 os.rmdir(self.user_session_dir)
-                print(f"Cleaned up {self.user_session_dir}")
+                logger.debug("Cleaned up %s", self.user_session_dir)
+            except FileNotFoundError:
+                pass
             
             # Remove user directory if empty
             user_dir = f"temp_videos/{self.user_id}"
-            if os.path.exists(user_dir) and not os.listdir(user_dir):
+            try:
                 os.rmdir(user_dir)
-                print(f"Cleaned up {user_dir}")
+                logger.debug("Cleaned up %s", user_dir)
+            except OSError:
+                # Missing, or still holding other sessions
+                pass
         except Exception as e:
-            print(f"Error cleaning up: {e}")
+            logger.error("Error cleaning up: %s", e)
 
 
 async def upload_to_supabase(video_path: str, session_id: str, user_id: str = "anonymous") -> Optional[str]:
     """Upload video to Supabase storage with organized path structure"""
     if not supabase:
-        print("Supabase client not initialized")
+        logger.warning("Supabase client not initialized")
         return None
     
     try:
@@ -295,8 +680,9 @@ async def upload_to_supabase(video_path: str, session_id: str, user_id: str = "a
         extension = file_path.suffix.lower()
 
         if extension != ".mp4":
-            print(
-                f"Upload aborted: expected MP4 file but received '{extension or 'unknown'}'"
+            logger.warning(
+                "Upload aborted: expected MP4 file but received '%s'",
+                extension or 'unknown',
             )
             return None
 
@@ -304,54 +690,58 @@ async def upload_to_supabase(video_path: str, session_id: str, user_id: str = "a
 
         # Organize in Supabase storage as: user_id/session_id.mp4
         storage_path = f"{user_id}/{session_id}.mp4"
-        
-        # Read video file
-        with open(video_path, "rb") as f:
-            video_data = f.read()
 
-        if not video_data:
-            print("Supabase upload aborted: video file is empty")
-            return None
+        def upload_file():
+            # Hand the open file to the client so the body streams from disk
+            with open(video_path, "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
 
-        file_size = len(video_data)
+                if not file_size:
+                    logger.warning("Supabase upload aborted: video file is empty")
+                    return None
 
-        print(
-            f"Uploading {storage_path} to Supabase (size={file_size} bytes, content_type={content_type})"
-        )
-        
-        # Upload to Supabase storage
-        file_options = {
-            "content-type": content_type,
-            # Supabase Python client expects header values to be strings
-            "upsert": "true"
-        }
-
-        response = supabase.storage.from_(supabase_bucket).upload(
-            storage_path,
-            video_data,
-            file_options=file_options
-        )
-        print(f"Supabase upload response: {response}")
-        
-        # Get public URL
-        public_url = supabase.storage.from_(supabase_bucket).get_public_url(storage_path)
-        
-        print(f"Video uploaded to Supabase: {public_url}")
-        return public_url
+                logger.info(
+                    "Uploading %s to Supabase (size=%s bytes, content_type=%s)",
+                    storage_path,
+                    file_size,
+                    content_type,
+                )
+
+                # Upload to Supabase storage
+                file_options = {
+                    "content-type": content_type,
+                    # Supabase Python client expects header values to be strings
+                    "upsert": "true"
+                }
+
+                response = supabase.storage.from_(supabase_bucket).upload(
+                    storage_path,
+                    f,
+                    file_options=file_options
+                )
+            logger.debug("Supabase upload response: %s", response)
+
+            # Get public URL
+            public_url = supabase.storage.from_(supabase_bucket).get_public_url(storage_path)
+
+            logger.info("Video uploaded to Supabase: %s", public_url)
+            return public_url
+
+        # The storage client is blocking; keep the upload off the event loop
+        return await asyncio.to_thread(upload_file)
     except Exception as e:
-        print(f"Error uploading to Supabase: {e}")
+        logger.error("Error uploading to Supabase: %s", e)
         return None
 
 
 async def get_user_videos(user_id: str) -> Optional[List[dict]]:
     """Retrieve all videos for a specific user from Supabase storage"""
     if not supabase:
-        print("Supabase client not initialized")
+        logger.warning("Supabase client not initialized")
         return None
     
-    try:
-        # List all files in the user's folder
-        response = (
+    def list_files():
+        return (
             supabase.storage
             .from_("videos")
             .list(
@@ -359,33 +749,43 @@ async def get_user_videos(user_id: str) -> Optional[List[dict]]:
 
             )
         )
-        print(f"Supabase list response: {response}")
-        print(f"Length of response: {len(response) if response else 0}")
+
+    try:
+        # List all files in the user's folder (the one network round-trip;
+        # supabase-py is blocking, so keep it off the event loop)
+        response = await asyncio.to_thread(list_files)
+        logger.debug("Supabase list response: %s", response)
+        logger.debug("Length of response: %s", len(response) if response else 0)
         
         if not response:
-            print(f"No videos found for user {user_id}")
+            logger.warning("No videos found for user %s", user_id)
             return []
         
+        # Public URLs are built locally by the client, no request per file
+        bucket = supabase.storage.from_(supabase_bucket)
+        
         videos = []
         for file in response:
+            file_name = file.get('name', '')
+            
             # Skip folders and files without metadata (folders don't have .mp4 extension)
-            if not file.get('name', '').endswith('.mp4'):
-                print(f"Skipping non-video file/folder: {file.get('name')}")
+            if not file_name.endswith('.mp4'):
+                logger.debug("Skipping non-video file/folder: %s", file_name)
                 continue
                 
             # Skip if no metadata (folders don't have metadata)
             if not file.get('metadata'):
-                print(f"Skipping item without metadata: {file.get('name')}")
+                logger.debug("Skipping item without metadata: %s", file_name)
                 continue
             
             # Each file represents a session
-            file_path = f"{user_id}/{file['name']}"
+            file_path = f"{user_id}/{file_name}"
             
             # Get public URL
-            public_url = supabase.storage.from_(supabase_bucket).get_public_url(file_path)
+            public_url = bucket.get_public_url(file_path)
             
-            # Extract session_id from filename (remove .mp4 extension)
-            session_id = file['name'].replace('.mp4', '')
+            # Extract session_id from filename (drop the .mp4 suffix checked above)
+            session_id = file_name[:-4]
             
             video_info = {
                 "session_id": session_id,
@@ -393,17 +793,39 @@ async def get_user_videos(user_id: str) -> Optional[List[dict]]:
                 "created_at": file.get('created_at', ''),
                 "updated_at": file.get('updated_at', ''),
                 "size": file.get('metadata', {}).get('size', 0),
-                "name": file['name']
+                "name": file_name
             }
             videos.append(video_info)
         
         # Sort by created date (newest first)
         videos.sort(key=lambda x: x.get('created_at', ''), reverse=True)
         
-        print(f"Found {len(videos)} videos for user {user_id}")
+        logger.info("Found %s videos for user %s", len(videos), user_id)
         return videos
     except Exception as e:
-        print(f"Error retrieving videos for user {user_id}: {e}")
+        logger.error("Error retrieving videos for user %s: %s", user_id, e)
+        return None
+
+
+async def get_feedback_segments(session_id: str) -> Optional[List[dict]]:
+    """Retrieve AI feedback segments for a session, ordered by start time"""
+    if not supabase:
+        logger.warning("Supabase client not initialized")
+        return None
+
+    def query_segments():
+        response = supabase.table("ai_feedback_segments")\
+            .select("*")\
+            .eq("session_id", session_id)\
+            .order("start_seconds", desc=False)\
+            .execute()
+        return response.data if response.data else []
+
+    try:
+        # supabase-py is blocking; keep the query off the event loop
+        return await asyncio.to_thread(query_segments)
+    except Exception as e:
+        logger.error("Error retrieving feedback for session %s: %s", session_id, e)
         return None
 
 
@@ -429,7 +851,7 @@ async def save_feedback_segments_to_supabase(
 
     if not supabase:
         error_msg = "Supabase client not initialized"
-        print(error_msg)
+        logger.warning(error_msg)
         return {"success": False, "count": 0, "error": error_msg}
 
     rows = []
@@ -452,14 +874,21 @@ async def save_feedback_segments_to_supabase(
         return {"success": True, "count": 0}
 
     def insert_rows():
+        # One bulk insert per batch (a single round-trip for typical sessions)
+        saved_count = 0
+        saved_data: List[dict] = []
         try:
-            response = supabase.table("ai_feedback_segments").insert(rows).execute()
-            data = getattr(response, "data", None)
-            saved_count = len(data) if data else len(rows)
-            return {"success": True, "count": saved_count, "data": data}
+            for start in range(0, len(rows), FEEDBACK_INSERT_BATCH_SIZE):
+                batch = rows[start:start + FEEDBACK_INSERT_BATCH_SIZE]
+                response = supabase.table("ai_feedback_segments").insert(batch).execute()
+                data = getattr(response, "data", None)
+                saved_count += len(data) if data else len(batch)
+                if data:
+                    saved_data.extend(data)
+            return {"success": True, "count": saved_count, "data": saved_data}
         except Exception as exc:
             error_text = str(exc)
-            print(f"Error saving feedback segments: {error_text}")
-            return {"success": False, "count": 0, "error": error_text}
+            logger.error("Error saving feedback segments: %s", error_text)
+            return {"success": False, "count": saved_count, "error": error_text}
 
     return await asyncio.to_thread(insert_rows)
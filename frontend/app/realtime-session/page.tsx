@@ -27,6 +27,38 @@ const formatTime = (totalSeconds: number) => {
   return `${minutes}:${seconds.toString().padStart(2, "0")}`;
 };
 
+// Binary WebSocket frames: 1-byte message type + 4-byte big-endian timestamp
+// (ms since capture start) + raw payload. Control messages stay JSON.
+const BINARY_HEADER_SIZE = 5;
+const BINARY_MESSAGE_TYPES = {
+  frame: 0x01,
+  videoChunk: 0x02,
+  videoComplete: 0x03,
+  audio: 0x04,
+  // Batched frames: repeated [4-byte big-endian length][image]
+  frames: 0x05,
+} as const;
+
+const packBinaryMessage = (
+  type: number,
+  timestampMs: number,
+  payload: Uint8Array
+) => {
+  const message = new Uint8Array(BINARY_HEADER_SIZE + payload.length);
+  const view = new DataView(message.buffer);
+  view.setUint8(0, type);
+  view.setUint32(1, timestampMs >>> 0);
+  message.set(payload, BINARY_HEADER_SIZE);
+  return message;
+};
+
+// JSON control messages are sent as binary frames too, so the server can
+// parse the bytes directly. JSON always starts with "{", which is never
+// used as a binary message type.
+const jsonEncoder = new TextEncoder();
+const packJsonMessage = (payload: Record<string, unknown>) =>
+  jsonEncoder.encode(JSON.stringify(payload));
+
 export default function WebcamPage() {
   const videoRef = useRef<HTMLVideoElement>(null);
   const wsRef = useRef<WebSocket | null>(null);
@@ -85,6 +117,9 @@ export default function WebcamPage() {
 
   const connectWebSocket = () => {
     const ws = new WebSocket("ws://localhost:8000/ws/video");
+    // Server messages arrive as binary orjson frames
+    ws.binaryType = "arraybuffer";
+    const decoder = new TextDecoder();
 
     ws.onopen = () => {
       console.log("WebSocket connected");
@@ -94,7 +129,7 @@ export default function WebcamPage() {
       // Send user authentication immediately after connection
       if (userId) {
         ws.send(
-          JSON.stringify({
+          packJsonMessage({
             type: "auth",
             user_id: userId,
           })
@@ -104,107 +139,113 @@ export default function WebcamPage() {
     };
 
     ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-
-      if (data.type === "auth_success") {
-        console.log("Authentication successful:", data.session_id);
-        setSessionId(data.session_id);
-      } else if (data.type === "ai_feedback") {
-        // Handle AI feedback from the feedback agent
-        console.log("AI Feedback received:", data.message);
-        const isActionable =
-          data.is_actionable ?? (data.message && data.message !== "OK");
-
-        if (isActionable && data.message) {
-          const startValue = Number.parseFloat(
-            data.start_seconds ?? data.startSeconds ?? 0
+      const parsed = JSON.parse(
+        typeof event.data === "string" ? event.data : decoder.decode(event.data)
+      );
+      // The server coalesces queued events into {"type":"batch","items":[...]}
+      const messages = parsed.type === "batch" ? parsed.items : [parsed];
+
+      for (const data of messages) {
+        if (data.type === "auth_success") {
+          console.log("Authentication successful:", data.session_id);
+          setSessionId(data.session_id);
+        } else if (data.type === "ai_feedback") {
+          // Handle AI feedback from the feedback agent
+          console.log("AI Feedback received:", data.message);
+          const isActionable =
+            data.is_actionable ?? (data.message && data.message !== "OK");
+
+          if (isActionable && data.message) {
+            const startValue = Number.parseFloat(
+              data.start_seconds ?? data.startSeconds ?? 0
+            );
+            const endValue = Number.parseFloat(
+              data.end_seconds ?? data.endSeconds ?? startValue
+            );
+            const startSeconds = Number.isFinite(startValue) ? startValue : 0;
+            const endSeconds = Number.isFinite(endValue)
+              ? Math.max(endValue, startSeconds)
+              : startSeconds;
+            const createdAt =
+              (data.created_at as string | undefined) ?? new Date().toISOString();
+
+            const rangeLabel = `${formatTime(startSeconds)} - ${formatTime(
+              endSeconds
+            )}`;
+
+            setFeedbackSegments((prev) => {
+              const index =
+                (data.segment_index as number | undefined) ?? prev.length;
+              const segmentId = `${
+                (data.session_id as string | undefined) ?? sessionId ?? "session"
+              }-${index}`;
+
+              if (prev.some((segment) => segment.id === segmentId)) {
+                return prev;
+              }
+
+              return [
+                ...prev,
+                {
+                  id: segmentId,
+                  feedbackText: data.message as string,
+                  startSeconds,
+                  endSeconds,
+                  createdAt,
+                },
+              ];
+            });
+
+            setFeedbackText(`${rangeLabel} - ${data.message}`);
+            setIsAIFeedback(true);
+            setTimeout(() => setIsAIFeedback(false), 4000);
+          } else if (data.message && data.message !== "OK") {
+            setFeedbackText(data.message);
+            setIsAIFeedback(true);
+            setTimeout(() => setIsAIFeedback(false), 4000);
+          }
+        } else if (data.type === "feedback") {
+          setFeedbackText(data.message);
+          setIsAIFeedback(false);
+        } else if (data.type === "status") {
+          const processed =
+            data.segments_processed ?? data.frames_processed ?? data.timestamp;
+          setFeedbackText(
+            processed
+              ? `Recording in progress… (${processed} segments captured)`
+              : "Recording in progress…"
           );
-          const endValue = Number.parseFloat(
-            data.end_seconds ?? data.endSeconds ?? startValue
+          setIsAIFeedback(false);
+        } else if (data.type === "upload_complete") {
+          setFeedbackText(`Video uploaded successfully! URL: ${data.url}`);
+          setIsAIFeedback(false);
+          console.log("Video URL:", data.url);
+        } else if (data.type === "feedback_saved") {
+          const savedCount = data.segments_saved ?? data.count ?? 0;
+          setFeedbackText(
+            savedCount
+              ? `Saved ${savedCount} feedback note${savedCount === 1 ? "" : "s"}`
+              : "No actionable feedback to save"
           );
-          const startSeconds = Number.isFinite(startValue) ? startValue : 0;
-          const endSeconds = Number.isFinite(endValue)
-            ? Math.max(endValue, startSeconds)
-            : startSeconds;
-          const createdAt =
-            (data.created_at as string | undefined) ?? new Date().toISOString();
-
-          const rangeLabel = `${formatTime(startSeconds)} - ${formatTime(
-            endSeconds
-          )}`;
-
-          setFeedbackSegments((prev) => {
-            const index =
-              (data.segment_index as number | undefined) ?? prev.length;
-            const segmentId = `${
-              (data.session_id as string | undefined) ?? sessionId ?? "session"
-            }-${index}`;
-
-            if (prev.some((segment) => segment.id === segmentId)) {
-              return prev;
-            }
-
-            return [
-              ...prev,
-              {
-                id: segmentId,
-                feedbackText: data.message as string,
-                startSeconds,
-                endSeconds,
-                createdAt,
-              },
-            ];
-          });
-
-          setFeedbackText(`${rangeLabel} - ${data.message}`);
-          setIsAIFeedback(true);
-          setTimeout(() => setIsAIFeedback(false), 4000);
-        } else if (data.message && data.message !== "OK") {
-          setFeedbackText(data.message);
-          setIsAIFeedback(true);
-          setTimeout(() => setIsAIFeedback(false), 4000);
+          setIsAIFeedback(false);
+          console.log("Feedback segments saved:", savedCount);
+          ws.close();
+          wsRef.current = null;
+        } else if (data.type === "feedback_save_error") {
+          const message = data.message ?? "Failed to save feedback";
+          setFeedbackText(`Error saving feedback: ${message}`);
+          setIsAIFeedback(false);
+          setError(message);
+          console.error("Feedback save error:", message);
+          ws.close();
+          wsRef.current = null;
+        } else if (data.type === "upload_error") {
+          setFeedbackText(`Error: ${data.message}`);
+          setIsAIFeedback(false);
+          setError(data.message);
+          ws.close();
+          wsRef.current = null;
         }
-      } else if (data.type === "feedback") {
-        setFeedbackText(data.message);
-        setIsAIFeedback(false);
-      } else if (data.type === "status") {
-        const processed =
-          data.segments_processed ?? data.frames_processed ?? data.timestamp;
-        setFeedbackText(
-          processed
-            ? `Recording in progress… (${processed} segments captured)`
-            : "Recording in progress…"
-        );
-        setIsAIFeedback(false);
-      } else if (data.type === "upload_complete") {
-        setFeedbackText(`Video uploaded successfully! URL: ${data.url}`);
-        setIsAIFeedback(false);
-        console.log("Video URL:", data.url);
-      } else if (data.type === "feedback_saved") {
-        const savedCount = data.segments_saved ?? data.count ?? 0;
-        setFeedbackText(
-          savedCount
-            ? `Saved ${savedCount} feedback note${savedCount === 1 ? "" : "s"}`
-            : "No actionable feedback to save"
-        );
-        setIsAIFeedback(false);
-        console.log("Feedback segments saved:", savedCount);
-        ws.close();
-        wsRef.current = null;
-      } else if (data.type === "feedback_save_error") {
-        const message = data.message ?? "Failed to save feedback";
-        setFeedbackText(`Error saving feedback: ${message}`);
-        setIsAIFeedback(false);
-        setError(message);
-        console.error("Feedback save error:", message);
-        ws.close();
-        wsRef.current = null;
-      } else if (data.type === "upload_error") {
-        setFeedbackText(`Error: ${data.message}`);
-        setIsAIFeedback(false);
-        setError(data.message);
-        ws.close();
-        wsRef.current = null;
       }
     };
 
@@ -225,9 +266,14 @@ export default function WebcamPage() {
   };
 
   const startMediaRecording = (stream: MediaStream) => {
-    const mimeType = "video/webm;codecs=vp8,opus";
-
-    if (!MediaRecorder.isTypeSupported(mimeType)) {
+    // Prefer H.264 where the browser can record it into WebM: the server then
+    // copies the video stream into the MP4 instead of re-encoding it
+    const mimeType = [
+      "video/webm;codecs=h264,opus",
+      "video/webm;codecs=vp8,opus",
+    ].find((type) => MediaRecorder.isTypeSupported(type));
+
+    if (!mimeType) {
       console.error("MIME type not supported");
       setError("Browser doesn't support required video format");
       return;
@@ -240,6 +286,8 @@ export default function WebcamPage() {
     });
 
     videoChunksRef.current = [];
+    const recordingStart = performance.now();
+    const elapsedMs = () => Math.round(performance.now() - recordingStart);
 
     mediaRecorder.ondataavailable = (event) => {
       if (event.data.size > 0) {
@@ -251,17 +299,16 @@ export default function WebcamPage() {
 
         // Also send chunk to server (for real-time processing if needed)
         if (wsRef.current?.readyState === WebSocket.OPEN) {
-          const reader = new FileReader();
-          reader.onloadend = () => {
-            const base64Data = reader.result as string;
+          const timestampMs = elapsedMs();
+          event.data.arrayBuffer().then((buffer) => {
             wsRef.current?.send(
-              JSON.stringify({
-                type: "video_chunk",
-                data: base64Data,
-              })
+              packBinaryMessage(
+                BINARY_MESSAGE_TYPES.videoChunk,
+                timestampMs,
+                new Uint8Array(buffer)
+              )
             );
-          };
-          reader.readAsDataURL(event.data);
+          });
         }
       }
     };
@@ -278,7 +325,7 @@ export default function WebcamPage() {
         console.log("No recorded chunks, sending stop without video");
         if (wsRef.current?.readyState === WebSocket.OPEN) {
           wsRef.current.send(
-            JSON.stringify({
+            packJsonMessage({
               type: "stop",
             })
           );
@@ -292,30 +339,29 @@ export default function WebcamPage() {
         `Creating final blob: ${blob.size} bytes from ${recordedChunks.length} chunks`
       );
 
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64Data = reader.result as string;
-        console.log(`Sending complete video: ${base64Data.length} chars`);
+      const timestampMs = elapsedMs();
+      blob.arrayBuffer().then((buffer) => {
+        console.log(`Sending complete video: ${buffer.byteLength} bytes`);
 
         if (wsRef.current?.readyState === WebSocket.OPEN) {
           wsRef.current.send(
-            JSON.stringify({
-              type: "video_complete",
-              data: base64Data,
-            })
+            packBinaryMessage(
+              BINARY_MESSAGE_TYPES.videoComplete,
+              timestampMs,
+              new Uint8Array(buffer)
+            )
           );
 
           wsRef.current.send(
-            JSON.stringify({
+            packJsonMessage({
               type: "stop",
             })
           );
         } else {
           console.error("WebSocket not open, cannot send video");
         }
-      };
+      });
 
-      reader.readAsDataURL(blob);
       mediaRecorderRef.current = null;
     };
 
@@ -327,6 +373,8 @@ export default function WebcamPage() {
   };
 
   const startFrameCapture = () => {
+    const captureStart = performance.now();
+
     // Capture and send a frame every second for AI analysis
     frameIntervalRef.current = setInterval(() => {
       if (videoRef.current && wsRef.current?.readyState === WebSocket.OPEN) {
@@ -337,18 +385,26 @@ export default function WebcamPage() {
         const ctx = canvas.getContext("2d");
         if (ctx && canvas.width > 0 && canvas.height > 0) {
           ctx.drawImage(videoRef.current, 0, 0);
-          const base64Frame = canvas.toDataURL("image/jpeg", 0.7);
-
-          console.log(
-            `Sending frame: ${canvas.width}x${canvas.height}, size: ${base64Frame.length} chars`
-          );
-
-          // Send frame for AI analysis
-          wsRef.current.send(
-            JSON.stringify({
-              type: "frame",
-              data: base64Frame,
-            })
+          const timestampMs = Math.round(performance.now() - captureStart);
+
+          canvas.toBlob(
+            async (blob) => {
+              if (!blob) return;
+              const jpeg = new Uint8Array(await blob.arrayBuffer());
+
+              console.log(
+                `Sending frame: ${canvas.width}x${canvas.height}, size: ${jpeg.length} bytes`
+              );
+
+              // Send frame for AI analysis as a binary message
+              if (wsRef.current?.readyState === WebSocket.OPEN) {
+                wsRef.current.send(
+                  packBinaryMessage(BINARY_MESSAGE_TYPES.frame, timestampMs, jpeg)
+                );
+              }
+            },
+            "image/jpeg",
+            0.7
           );
         } else {
           console.log("Canvas not ready yet:", canvas.width, canvas.height);